@@ -0,0 +1,212 @@
+import argparse, json, os, random, shutil, sys, tempfile, time
+import src.reversi as reversi
+import src.bitboard as bitboard
+import src.server_utils as server_utils
+import src.sandbox as sandbox
+
+
+BOTS = {
+    "naiveBot" : os.path.join("static", "bots", "naiveBot.py"),
+    "lessNaiveBot" : os.path.join("static", "bots", "lessNaiveBot.py"),
+    "dalit" : os.path.join("static", "unused_bots", "dalit.py"),
+}
+THRESHOLD = 1.25   #slower than the baseline by this factor counts as a regression
+SEARCH_DEPTH = 5   #depth dalit's search has to finish on every test position
+
+
+#positions from random games with a fixed seed, so every run measures the same boards
+def sample_positions(count, seed=1):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = reversi.reversi()
+        me = reversi.FIRST
+        while game.winner() == reversi.UNKNOWN and len(positions) < count:
+            moves = list(game.get_moves(me))
+            if moves:
+                positions.append((game.get_board(), me))
+                game.play(*rng.choice(moves), me)
+            me = reversi.SECOND if me == reversi.FIRST else reversi.FIRST
+    return positions
+
+
+#seconds per call of func, best of `repeat` rounds
+def timeit(func, number, repeat=3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        took = (time.perf_counter() - start) / number
+        best = took if best is None else min(best, took)
+    return best
+
+
+def bench_engine(engine, positions, number) -> dict:
+    games = []
+    for board, me in positions:
+        game = engine.reversi()
+        game.board = [list(l) for l in board]
+        games.append((game, me))
+
+    def can_move():
+        for game, me in games:
+            for i in range(reversi.BOARD_SIZE):
+                for j in range(reversi.BOARD_SIZE):
+                    game.can_move(i, j, me)
+
+    def winner():
+        for game, _ in games:
+            game.moves = {}
+            game.winner()
+
+    #play changes the board, so every round plays on fresh copies made outside the timer
+    def play_time():
+        copies = []
+        for game, me in games:
+            copy = engine.reversi()
+            copy.board = [list(l) for l in game.board]
+            copies.append((copy, me, next(iter(game.get_moves(me)))))
+
+        start = time.perf_counter()
+        for copy, me, (x, y) in copies:
+            copy.play(x, y, me)
+        return time.perf_counter() - start
+
+    def get_board():
+        for game, _ in games:
+            game.get_board()
+
+    #a search step: every move of the position played and taken back in place
+    def play_undo():
+        for game, me in games:
+            for x, y in list(game.get_moves(me)):
+                game.undo(game.play(x, y, me))
+
+    n = len(games)
+    return {
+        "can_move" : timeit(can_move, number) / (n * reversi.BOARD_SIZE ** 2),
+        "winner" : timeit(winner, number) / n,
+        "play" : min(play_time() for _ in range(number)) / n,
+        "get_board" : timeit(get_board, number) / n,
+        "play_undo" : timeit(play_undo, number) / sum(len(game.get_moves(me)) for game, me in games),
+    }
+
+
+def bench_sandbox(number) -> dict:
+    board = reversi.reversi().get_board()
+    game = bitboard.reversi()
+    worker = sandbox.bot_worker("naiveBot", server_utils.TIMEOUT)
+    try:
+        res = {
+            "child_proc_getmove" : timeit(lambda: server_utils.child_proc_getmove("naiveBot", reversi.FIRST, board), number, 1),
+            "worker_start" : timeit(lambda: (worker.kill(), worker.start()), number, 1),
+            "worker_get_move" : timeit(lambda: worker.get_move(reversi.FIRST, game.first, game.second), number * 10, 1),
+        }
+    finally:
+        worker.close()
+    return res
+
+
+#dalit's time to SEARCH_DEPTH on a fixed set of midgame positions, serial and with
+#the helper processes of its parallel search
+def bench_search(processes) -> dict:
+    import dalit
+
+    positions = [(board, me) for board, me in sample_positions(400, seed=3)[::50]]
+    res = {}
+    for n in sorted({1, processes}):
+        parallel = dalit.ParallelSearch(n) if n > 1 else None
+        try:
+            start = time.perf_counter()
+            for board, me in positions:
+                ai = dalit.ReversiAI()
+                ai.depth = SEARCH_DEPTH
+                ai.setParallel(parallel)
+                game = dalit.Reversi()
+                game.load([list(l) for l in board], me)
+                ai.heuristicMove(game, me)
+            res["dalit search x%d" % n] = (time.perf_counter() - start) / len(positions)
+        finally:
+            if parallel:
+                parallel.close()
+    return res
+
+
+def bench_games(games) -> dict:
+    res = {}
+    for team in BOTS:
+        for enemy in BOTS:
+            start = time.perf_counter()
+            for i in range(games):
+                server_utils.play_game(team, enemy, seed=i)
+            res["play_game %s vs %s" % (team, enemy)] = (time.perf_counter() - start) / games
+    return res
+
+
+def run(number, games, processes) -> dict:
+    tmpdir = tempfile.mkdtemp()
+    old_basedir = server_utils.basedir
+    try:
+        for name, path in BOTS.items():
+            shutil.copy(path, os.path.join(tmpdir, name + ".py"))
+        server_utils.basedir = tmpdir
+        sys.path.append(tmpdir)
+
+        positions = sample_positions(50)
+        res = {}
+        for engine in [reversi, bitboard]:
+            for op, took in bench_engine(engine, positions, number).items():
+                res["%s.%s" % (engine.__name__, op)] = took
+        res.update(bench_sandbox(number))
+        res.update(bench_search(processes))
+        res.update(bench_games(games))
+    finally:
+        server_utils.basedir = old_basedir
+        sys.path.remove(tmpdir)
+        shutil.rmtree(tmpdir)
+    return res
+
+
+#names of the results that got slower than the baseline
+def regressions(res, baseline) -> list:
+    return [k for k in res if k in baseline and res[k] > baseline[k] * THRESHOLD]
+
+
+def report(res, baseline=None) -> str:
+    lines = []
+    for k, v in res.items():
+        line = "%-45s %12.2f us" % (k, v * 1e6)
+        if k.startswith("play_game"):
+            line += "   %8.1f games/s" % (1 / v)
+        if baseline and k in baseline:
+            line += "   x%.2f" % (v / baseline[k])
+            if v > baseline[k] * THRESHOLD:
+                line += "  REGRESSION"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the engines, the bot sandbox and full games")
+    parser.add_argument("--number", type=int, default=20, help="rounds per engine / sandbox measurement")
+    parser.add_argument("--games", type=int, default=3, help="games per bot pairing")
+    parser.add_argument("--processes", type=int, default=4, help="processes of dalit's parallel search")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--check", help="compare against a JSON baseline, exit 1 on regressions")
+    args = parser.parse_args()
+
+    res = run(args.number, args.games, args.processes)
+    baseline = None
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+    print(report(res, baseline))
+    if args.processes > 1:
+        print("dalit parallel search speedup with %d processes: x%.2f" % (args.processes, res["dalit search x1"] / res["dalit search x%d" % args.processes]))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(res, f, indent=4)
+    if baseline and regressions(res, baseline):
+        sys.exit(1)
@@ -1,9 +1,30 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request
+import src.reversi as reversi
 import src.server_utils as server_utils
-import os 
+import src.game_pool as game_pool
+import src.tournament as tournament
+import src.ladder as ladder
+import src.result_cache as result_cache
+import src.metrics as metrics
+import src.jobs as jobs
+import src.sandbox as sandbox
+import src.archive as archive
+import os, threading, json as jsonlib
 
 
 players_count = 50
+DEFAULT_SEED = 0
+MAX_SEED = 2 ** 63   #seeds are kept as signed 64 bit integers in the archive
+BOARD_SIZES = list(range(4, 15, 2))   #a move of the largest still fits the archive's one byte
+cache = result_cache.result_cache()
+stats = metrics.registry()
+last_tournament = {"running" : False, "standings" : []}
+pool = game_pool.game_pool(size=os.cpu_count() or 1, max_queue=4 * (os.cpu_count() or 1))
+#pool processes are forked from this one, so the hook is set in them too
+server_utils.game_hooks.append(archive.record_game)
+server_utils.game_hooks.append(ladder.record_game)
+live_jobs = {}   #job API id -> pool job id, for the jobs handed to the pool
+wake_scheduler = threading.Event()
 app = Flask(__name__, static_folder = os.path.join('static', 'style'), template_folder= os.path.join("static", "templates"))
 
 
@@ -24,7 +45,14 @@ def submit_code():
         return "Incorrect passcode", 400
 
     python = request.form.get("python")
-    server_utils.save_to_py_file(passcode, python)
+    try: 
+        server_utils.save_to_py_file(passcode, python)
+    except SyntaxError as e: 
+        return "Syntax error in line %s: %s" % (e.lineno, e.msg), 400
+    #the ladder's replay games queue as jobs, so they wait for room in the pool like any game
+    for team, enemy in ladder.resubmitted(passcode): 
+        jobs.add("game", {"team" : team, "enemy" : enemy, "seed" : None, "replay" : True})
+    wake_scheduler.set()
 
     return render_template("great_success.html")
     
@@ -44,10 +72,196 @@ def run_sim():
     
     if not server_utils.verify_exists(enemy): 
         return "Wrong enemy!"
-    json = server_utils.play_game(team, enemy)
-    return render_template("showgame.html", json_string=json)
+
+    seed = request.form.get("seed") or DEFAULT_SEED
+    if not str(seed).isdigit() or int(seed) >= MAX_SEED: 
+        return "Wrong seed!", 400
+    seed = int(seed)
+
+    size = request.form.get("size") or reversi.BOARD_SIZE
+    if not str(size).isdigit() or int(size) not in BOARD_SIZES: 
+        return "Wrong board size!", 400
+    size = int(size)
+
+    #async: answer with a job id right away, the scheduler runs the game when there is room
+    if request.form.get("async") or request.args.get("async"): 
+        job_id = jobs.add("game", {"team" : team, "enemy" : enemy, "seed" : seed, "size" : size})
+        wake_scheduler.set()
+        return {"job" : job_id, "status" : "/jobs/%d" % job_id}, 202
+
+    key = cache.key(team, enemy, seed, size)
+    json = cache.get(key)
+    if json is not None: 
+        return render_template("showgame.html", json_string=json, job_id=None, size=size)
+
+    #the page streams the moves from /stream, viewers of the same game share one run
+    job_id = pool.submit(team, enemy, seed, key=key, on_done=lambda res: game_done(key, team, enemy, res), size=size)
+    if job_id is None: 
+        retry = pool.retry_after()
+        return "Too many games running, try again in %d seconds" % retry, 429, {"Retry-After" : str(retry)}
+    return render_template("showgame.html", json_string=None, job_id=job_id, size=size)
+
+
+def game_done(key, team, enemy, res): 
+    if "error" in res: 
+        return
+    stats.observe_game(res)
+    cache.put(key, team, enemy, res)
+
+
+#hand queued jobs to the pool while it has room, at startup this also resumes the
+#jobs a previous run of the server did not finish
+def scheduler(): 
+    jobs.requeue()
+    while True: 
+        for job_id, kind, args in jobs.unfinished(): 
+            if job_id in live_jobs: 
+                continue
+            if kind == "tournament": 
+                if not last_tournament["running"] and jobs.start(job_id): 
+                    last_tournament["running"] = True
+                    live_jobs[job_id] = None
+                    threading.Thread(target=tournament_thread, args=(job_id,), daemon=True).start()
+                continue
+            #the job may have finished since the list was read, then it is not queued anymore
+            if not jobs.start(job_id): 
+                continue
+            if not start_job(job_id, args): 
+                break
+        wake_scheduler.wait(timeout=1)
+        wake_scheduler.clear()
+
+
+#Hand a job marked running to the pool, False (and queued again) when the pool is full
+def start_job(job_id, args) -> bool: 
+    team, enemy, seed = args["team"], args["enemy"], args["seed"]
+    size = args.get("size", reversi.BOARD_SIZE)
+    try: 
+        key = cache.key(team, enemy, seed, size)
+    except OSError: 
+        #the bot was removed while the job waited
+        jobs.finish(job_id, {"error" : "No such bot"})
+        return True
+
+    #a replay is played even if the result is cached, the ladder rates the games it plays
+    json = None if args.get("replay") else cache.get(key)
+    if json is not None: 
+        jobs.finish(job_id, json)
+        return True
+
+    pool_id = pool.submit(team, enemy, seed, key=key, on_done=lambda res: game_done(key, team, enemy, res), size=size)
+    if pool_id is None: 
+        jobs.requeue(job_id)
+        return False
+    live_jobs[job_id] = pool_id
+    pool.add_done(pool_id, lambda res: job_done(job_id, res))
+    return True
+
+
+def job_done(job_id, res): 
+    jobs.finish(job_id, res)
+    live_jobs.pop(job_id, None)
+    wake_scheduler.set()
+
+
+@app.route("/jobs/<int:job_id>", methods=["GET"])
+def job_status(job_id): 
+    job = jobs.get(job_id)
+    if job is None: 
+        return "No such job", 404
+
+    pool_id = live_jobs.get(job_id)
+    if job["status"] == "running" and pool_id is not None: 
+        live = pool.find(pool_id)
+        if live is not None: 
+            job["moves_played"] = len(live["moves"])
+        job["watch"] = "/watch?job=%d" % pool_id
+    return job
+
+
+@app.route("/watch", methods=["GET"])
+def watch_game(): 
+    job_id = request.args.get("job", "")
+    job = pool.find(int(job_id)) if job_id.isdigit() else None
+    if job is None: 
+        return "No such game", 404
+    return render_template("showgame.html", json_string=None, job_id=int(job_id), size=job["size"])
+
+
+#Server-Sent Events: one "move" event per move as it is played, then an "end" event
+#with the result (moves are left out, the viewer has them already)
+@app.route("/stream", methods=["GET"])
+def stream_game(): 
+    job_id = request.args.get("job", "")
+    if not job_id.isdigit() or pool.find(int(job_id)) is None: 
+        return "No such game", 404
+
+    def events(): 
+        moves = pool.follow(int(job_id))
+        try: 
+            while True: 
+                yield "event: move\ndata: %s\n\n" % jsonlib.dumps(next(moves))
+        except StopIteration as done: 
+            res = done.value
+        end = {"error" : res["error"]} if "error" in res else {"winner" : res["winner"], "discs" : res["discs"]}
+        yield "event: end\ndata: %s\n\n" % jsonlib.dumps(end)
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control" : "no-cache", "X-Accel-Buffering" : "no"})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_page(): 
+    return stats.render(), 200, {"Content-Type" : "text/plain; version=0.0.4"}
+
+
+@app.route("/queue", methods=["GET"])
+def queue_status(): 
+    return {"depth" : pool.depth(), "max" : pool.max_queue, "workers" : pool.size}
+
+
+
+def tournament_thread(job_id): 
+    res = {"error" : "Tournament failed"}
+    try: 
+        #on the server's pool, so tournament games queue with the others instead of
+        #forking a second set of game processes
+        last_tournament["standings"] = tournament.run_tournament(pool=pool)
+        res = {"standings" : last_tournament["standings"]}
+    finally: 
+        jobs.finish(job_id, res)
+        live_jobs.pop(job_id, None)
+        last_tournament["running"] = False
+        wake_scheduler.set()
+
+
+@app.route("/tournament", methods=["GET"])
+def tournament_standings(): 
+    return last_tournament
+
+
+@app.route("/tournament", methods=["POST"])
+def tournament_start(): 
+    passcode = request.form.get("passcode")
+    if not server_utils.verify_user(passcode): 
+        return "Incorrect passcode", 400
+
+    if last_tournament["running"] or any(kind == "tournament" for _, kind, _ in jobs.unfinished()): 
+        return "A tournament is already running", 409
+    job_id = jobs.add("tournament", {})
+    wake_scheduler.set()
+    return {"job" : job_id, "status" : "/jobs/%d" % job_id}, 202
+
+
+
+@app.route("/ladder", methods=["GET"])
+def ladder_standings(): 
+    return {"ratings" : ladder.standings()}
 
 
 if __name__ == "__main__":
     server_utils.generate_players(players_count)
+    #submissions start a bot worker from this process to time its import
+    sandbox.preload()
+    pool.start()
+    threading.Thread(target=scheduler, daemon=True).start()
     app.run(host='0.0.0.0', port=80)
\ No newline at end of file
@@ -0,0 +1,218 @@
+import os, sys, mmap, sqlite3, struct, argparse, time
+import src.reversi as reversi
+import src.bitboard as bitboard
+import src.server_utils as server_utils
+
+
+#Every played game, appended to one binary file. A record is a fixed header, the two
+#bot names and one byte per move (x * size + y), passes are not stored since replaying
+#the moves shows who had to pass. A sqlite index finds records by bot and date
+archive_dir = os.path.join(server_utils.basedir, "archive")
+data_path = os.path.join(archive_dir, "games.bin")
+db_path = os.path.join(archive_dir, "index.db")
+
+#record size, played at, seed (-1 for none), winner, discs first, discs second,
+#compute seconds first, compute seconds second, board size, team name length, enemy name length, moves
+HEADER = struct.Struct("<HdqbBBffBBBB")
+
+
+def encode(team, enemy, seed, res, played_at) -> bytes:
+    compute = [0.0, 0.0]
+    for t in res.get("timings", []):
+        compute[t["player"] - 1] += t["compute"] or 0.0
+
+    team_b, enemy_b = team.encode(), enemy.encode()
+    board_size = res.get("size", reversi.BOARD_SIZE)
+    #a bot that answers with a square off the board forfeits, that move is left out
+    moves = bytes(x * board_size + y for x, y in res["moves"] if 0 <= x < board_size and 0 <= y < board_size)
+    size = HEADER.size + len(team_b) + len(enemy_b) + len(moves)
+    cf, cs = res.get("discs", [0, 0])
+    #seeds that do not fit the field are stored as none
+    if seed is None or not 0 <= seed < 2 ** 63:
+        seed = -1
+    header = HEADER.pack(size, played_at, seed, res["winner"], cf, cs,
+                         compute[0], compute[1], board_size, len(team_b), len(enemy_b), len(moves))
+    return header + team_b + enemy_b + moves
+
+
+#the record at `offset` of buf and the offset of the next one
+def decode(buf, offset=0):
+    size, played_at, seed, winner, cf, cs, tf, ts, board_size, nt, ne, nm = HEADER.unpack_from(buf, offset)
+    pos = offset + HEADER.size
+    team = bytes(buf[pos:pos + nt]).decode()
+    enemy = bytes(buf[pos + nt:pos + nt + ne]).decode()
+    moves = bytes(buf[pos + nt + ne:pos + nt + ne + nm])
+    record = {"team" : team, "enemy" : enemy, "seed" : None if seed < 0 else seed, "played_at" : played_at,
+              "winner" : winner, "discs" : [cf, cs], "compute" : [tf, ts], "size" : board_size, "moves" : moves}
+    return record, offset + size
+
+
+def connect():
+    if not os.path.exists(archive_dir):
+        os.makedirs(archive_dir)
+
+    db = sqlite3.connect(db_path, timeout=30)
+    db.execute("CREATE TABLE IF NOT EXISTS games (offset INTEGER PRIMARY KEY, team TEXT, enemy TEXT, played_at REAL)")
+    db.execute("CREATE INDEX IF NOT EXISTS games_team ON games (team, played_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS games_enemy ON games (enemy, played_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS games_played_at ON games (played_at)")
+    return db
+
+
+#Append one play_game result. Safe from several processes: the record goes out in
+#a single O_APPEND write, which also tells where it landed
+def record_game(team, enemy, seed, res) -> None:
+    if "error" in res:
+        return
+
+    played_at = time.time()
+    data = encode(team, enemy, seed, res, played_at)
+    db = connect()
+    try:
+        fd = os.open(data_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            offset = os.lseek(fd, 0, os.SEEK_CUR) - len(data)
+        finally:
+            os.close(fd)
+        db.execute("INSERT INTO games VALUES (?, ?, ?, ?)", (offset, team, enemy, played_at))
+        db.commit()
+    finally:
+        db.close()
+
+
+#offsets of the games a bot played (as either color), between two timestamps
+def find(bot=None, since=None, until=None) -> list:
+    query, args = "SELECT offset FROM games WHERE 1", []
+    if bot is not None:
+        query += " AND (team = ? OR enemy = ?)"
+        args += [bot, bot]
+    if since is not None:
+        query += " AND played_at >= ?"
+        args.append(since)
+    if until is not None:
+        query += " AND played_at < ?"
+        args.append(until)
+
+    db = connect()
+    try:
+        return [o for o, in db.execute(query + " ORDER BY offset", args)]
+    finally:
+        db.close()
+
+
+#(offset, record) of every record in the file, read through one memory map
+def scan():
+    if not os.path.exists(data_path) or os.path.getsize(data_path) == 0:
+        return
+
+    with open(data_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        offset = 0
+        while offset + HEADER.size <= len(buf):
+            record, next_offset = decode(buf, offset)
+            #a record cut short by a crash in the middle of its write
+            if next_offset <= offset or next_offset > len(buf):
+                break
+            yield offset, record
+            offset = next_offset
+
+
+#the records at `offsets` (from find), or every record
+def read(offsets=None):
+    if offsets is None:
+        for _, record in scan():
+            yield record
+        return
+
+    if not offsets:
+        return
+    with open(data_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for offset in offsets:
+            yield decode(buf, offset)[0]
+
+
+#Play the moves of a record through reversi.play, the same way play_game does. With
+#on_position, it is called with (game, player) before every move.
+#engine: src.bitboard (fast, 8x8 only) or src.reversi, which other sizes always use
+def replay(moves, on_position=None, engine=bitboard, size=reversi.BOARD_SIZE):
+    game = engine.reversi() if size == reversi.BOARD_SIZE else reversi.reversi(size)
+    me = reversi.FIRST
+    for m in moves:
+        x, y = divmod(m, size)
+        #a move the player can not make is a pass, unless it had moves (an illegal move)
+        if not game.can_move(x, y, me) and not game.get_moves(me):
+            me = reversi.SECOND if me == reversi.FIRST else reversi.FIRST
+        if on_position:
+            on_position(game, me)
+        game.play(x, y, me)
+        me = reversi.SECOND if me == reversi.FIRST else reversi.FIRST
+    return game
+
+
+#(positions, distinct positions up to symmetry) in the 8x8 games of `records`, a
+#position being the discs and the player to move
+def count_positions(records):
+    index = bitboard.position_index()
+    total = 0
+    for record in records:
+        if record["size"] != reversi.BOARD_SIZE:
+            continue
+        def on_position(game, me):
+            index.add(*game.sides(me))
+        total += len(record["moves"])
+        replay(record["moves"], on_position)
+    return total, len(index)
+
+
+#rebuild the index from the data file, e.g. after a crash between the two writes
+def reindex() -> int:
+    db = connect()
+    try:
+        db.execute("DELETE FROM games")
+        count = 0
+        for offset, record in scan():
+            db.execute("INSERT INTO games VALUES (?, ?, ?, ?)", (offset, record["team"], record["enemy"], record["played_at"]))
+            count += 1
+        db.commit()
+    finally:
+        db.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay archived games and print per bot results")
+    parser.add_argument("--bot", help="only the games of this bot")
+    parser.add_argument("--days", type=float, help="only the games of the last DAYS days")
+    parser.add_argument("--reindex", action="store_true", help="rebuild the index from the data file first")
+    parser.add_argument("--positions", action="store_true", help="also count the distinct positions, up to symmetry")
+    args = parser.parse_args()
+
+    if args.reindex:
+        print("indexed %d games" % reindex())
+
+    since = time.time() - args.days * 86400 if args.days else None
+    offsets = find(args.bot, since) if args.bot or since else None
+
+    start = time.perf_counter()
+    rows = {}
+    count = mismatches = 0
+    for record in read(offsets):
+        game = replay(record["moves"], size=record["size"])
+        if [game.count(reversi.FIRST), game.count(reversi.SECOND)] != record["discs"]:
+            mismatches += 1
+        count += 1
+
+        for bot, me in [(record["team"], reversi.FIRST), (record["enemy"], reversi.SECOND)]:
+            row = rows.setdefault(bot, {"games" : 0, "wins" : 0, "moves" : 0})
+            row["games"] += 1
+            row["wins"] += record["winner"] == me or record["winner"] == me - 3
+            row["moves"] += len(record["moves"])
+    took = time.perf_counter() - start
+
+    for bot, row in sorted(rows.items(), key=lambda r: -r[1]["wins"] / r[1]["games"]):
+        print("%-20s %6d games %5.1f%% won %5.1f moves/game" % (bot, row["games"], 100 * row["wins"] / row["games"], row["moves"] / row["games"]))
+    print("replayed %d games in %.2f s (%.0f games/s), %d did not match their stored result" % (count, took, count / took if took else 0, mismatches))
+    if args.positions:
+        total, distinct = count_positions(read(offsets))
+        print("%d positions, %d distinct up to symmetry" % (total, distinct))
+    sys.exit(1 if mismatches else 0)
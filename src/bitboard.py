@@ -0,0 +1,379 @@
+from operator import add
+from src.reversi import UNKNOWN, FIRST, SECOND, TIE, BOARD_SIZE
+
+
+FULL = (1 << 64) - 1
+#columns, used to stop shifts from wrapping around a row
+COL_FIRST = sum(1 << (x * BOARD_SIZE) for x in range(BOARD_SIZE))
+COL_LAST = COL_FIRST << (BOARD_SIZE - 1)
+NOT_FIRST = FULL & ~COL_FIRST
+NOT_LAST = FULL & ~COL_LAST
+
+#(shift, mask on the opponent discs) for the 4 line directions, each is walked both ways.
+#square (x, y) is bit x * BOARD_SIZE + y, masking the edge columns out of the opponent
+#discs keeps a run from wrapping around a row
+INNER = NOT_FIRST & NOT_LAST
+DIRECTIONS = [(1, INNER), (BOARD_SIZE, FULL), (BOARD_SIZE - 1, INNER), (BOARD_SIZE + 1, INNER)]
+
+
+def bit(x, y) -> int:
+    return 1 << (x * BOARD_SIZE + y)
+
+
+#(x, y) -> bit of every square on the board, nothing for squares off it
+SQUARES = {(x, y) : bit(x, y) for x in range(BOARD_SIZE) for y in range(BOARD_SIZE)}
+
+
+#all the empty squares `own` can play on. A run of opponent discs is at most 6 long:
+#two single steps cover 2 of it, then steps over pairs of opponent discs cover 4 more
+def moves_mask(own, opp) -> int:
+    empty = FULL & ~(own | opp)
+    moves = 0
+    for s, mask in DIRECTIONS:
+        o = opp & mask
+        s2 = s + s
+
+        pairs = o & (o << s)
+        t = o & (own << s)
+        t |= o & (t << s)
+        t |= pairs & (t << s2)
+        t |= pairs & (t << s2)
+        moves |= empty & (t << s)
+
+        pairs = o & (o >> s)
+        t = o & (own >> s)
+        t |= o & (t >> s)
+        t |= pairs & (t >> s2)
+        t |= pairs & (t >> s2)
+        moves |= empty & (t >> s)
+    return moves
+
+
+#For every square (by bit index), the bits of the squares in each of the 8 directions
+#out to the edge, like src.reversi.rays. Directions with fewer than two squares can
+#never flip anything and are left out
+RAYS = [tuple(ray for ray in
+              (tuple(bit(x + dx * i, y + dy * i) for i in range(1, BOARD_SIZE)
+                     if 0 <= x + dx * i < BOARD_SIZE and 0 <= y + dy * i < BOARD_SIZE)
+               for dx in [-1, 0, 1] for dy in [-1, 0, 1] if dx or dy)
+              if len(ray) > 1)
+        for x in range(BOARD_SIZE) for y in range(BOARD_SIZE)]
+
+
+#the discs flipped when `own` plays on `move` (0 if the move is illegal). Walks the
+#rays of the square, most of them end at once on a neighbour that is not the opponent's
+def flips_mask(own, opp, move) -> int:
+    flips = 0
+    for ray in RAYS[move.bit_length() - 1]:
+        if not opp & ray[0]:
+            continue
+        line = 0
+        for b in ray:
+            if opp & b:
+                line |= b
+            else:
+                if own & b:
+                    flips |= line
+                break
+    return flips
+
+
+#boards of any size, square (x, y) is bit x * size + y (only 8x8 fits the engine below)
+def to_bitboards(board):
+    size = len(board)
+    first = second = 0
+    for x in range(size):
+        for y in range(size):
+            if board[x][y] == FIRST:
+                first |= 1 << (x * size + y)
+            elif board[x][y] == SECOND:
+                second |= 1 << (x * size + y)
+    return first, second
+
+
+#one row of bits -> the row of cell values, UNKNOWN is 0 so the two rows can be added
+ROW_MASK = (1 << BOARD_SIZE) - 1
+FIRST_ROWS = [[FIRST if (v >> y) & 1 else UNKNOWN for y in range(BOARD_SIZE)] for v in range(ROW_MASK + 1)]
+SECOND_ROWS = [[SECOND if (v >> y) & 1 else UNKNOWN for y in range(BOARD_SIZE)] for v in range(ROW_MASK + 1)]
+
+
+def to_board(first, second, size=BOARD_SIZE):
+    if size != BOARD_SIZE:
+        return [[FIRST if (first >> (x * size + y)) & 1 else SECOND if (second >> (x * size + y)) & 1 else UNKNOWN
+                 for y in range(size)] for x in range(size)]
+
+    board = []
+    for x in range(0, BOARD_SIZE * BOARD_SIZE, BOARD_SIZE):
+        board.append(list(map(add, FIRST_ROWS[(first >> x) & ROW_MASK], SECOND_ROWS[(second >> x) & ROW_MASK])))
+    return board
+
+
+#The 8 symmetries of the board. Rows are bytes, so reversing the bytes flips x,
+#reversing the bits of every byte flips y, and the delta swaps in transpose swap x and y
+def flip_x(b) -> int:
+    return int.from_bytes(b.to_bytes(8, "little"), "big")
+
+
+def flip_y(b) -> int:
+    b = ((b >> 1) & 0x5555555555555555) | ((b & 0x5555555555555555) << 1)
+    b = ((b >> 2) & 0x3333333333333333) | ((b & 0x3333333333333333) << 2)
+    return ((b >> 4) & 0x0F0F0F0F0F0F0F0F) | ((b & 0x0F0F0F0F0F0F0F0F) << 4)
+
+
+def transpose(b) -> int:
+    t = 0x0F0F0F0F00000000 & (b ^ (b << 28))
+    b ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (b ^ (b << 14))
+    b ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (b ^ (b << 7))
+    b ^= t ^ (t >> 7)
+    return b
+
+
+SYMMETRIES = [
+    lambda b: b,
+    flip_x,
+    flip_y,
+    lambda b: flip_x(flip_y(b)),
+    transpose,
+    lambda b: flip_x(transpose(b)),
+    lambda b: flip_y(transpose(b)),
+    lambda b: flip_x(flip_y(transpose(b))),
+]
+#index of the symmetry that undoes each one
+_probe = 0x0123456789ABCDEF
+INVERSE = [next(j for j, g in enumerate(SYMMETRIES) if g(f(_probe)) == _probe) for f in SYMMETRIES]
+
+
+#Both colors of a position as one 128 bit integer, own above opp. Comparing keys compares
+#(own, opp), and every symmetry can be applied to both halves at once: the transpose
+#masks repeat in each half, and as big endian bytes each half is one row per byte
+PAIR_MASKS = [(m | (m << 64), s) for m, s in [(0x0F0F0F0F00000000, 28), (0x3333000033330000, 14), (0x5500550055005500, 7)]]
+REVERSE_BITS = bytes(int("{:08b}".format(i)[::-1], 2) for i in range(256))
+
+
+def pair_key(own, opp) -> int:
+    return (own << 64) | opp
+
+
+def transpose_pair(k) -> int:
+    for mask, s in PAIR_MASKS:
+        t = mask & (k ^ (k << s))
+        k ^= t ^ (t >> s)
+    return k
+
+
+#the 8 symmetric versions of a pair key as 16 big endian bytes, in SYMMETRIES order
+def pair_images(k) -> list:
+    b = k.to_bytes(16, "big")
+    t = transpose_pair(k).to_bytes(16, "big")
+    images = []
+    for image in [b, b.translate(REVERSE_BITS), t, t.translate(REVERSE_BITS)]:
+        images.append(image)
+        images.append(image[7::-1] + image[:7:-1])   #flip_x: the rows of each half reversed
+    return images
+
+
+#The symmetry-independent key of a position: the smallest pair key of its 8 versions.
+#Positions that are rotations or mirrors of each other get the same key
+def canonical_key(own, opp) -> int:
+    return int.from_bytes(min(pair_images(pair_key(own, opp))), "big")
+
+
+#the smallest of the 8 symmetric versions of a position, and the symmetry that gives it
+def canonical(own, opp):
+    images = pair_images(pair_key(own, opp))
+    best = min(images)
+    k = int.from_bytes(best, "big")
+    return k >> 64, k & FULL, images.index(best)
+
+
+#Values by position up to symmetry, for caches and statistics that should see a
+#position and its mirror images once. Positions are (own, opp) from the point of view
+#of the player to move, values have to be the same in every orientation (store moves
+#in the frame of `canonical` and map them back with INVERSE)
+class position_index:
+    def __init__(self) -> None:
+        self.entries = {}   #canonical key -> value
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, own, opp, default=None):
+        key = canonical_key(own, opp)
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+
+    def put(self, own, opp, value) -> None:
+        self.entries[canonical_key(own, opp)] = value
+
+
+    #True if neither the position nor any of its mirror images was added before
+    def add(self, own, opp, value=None) -> bool:
+        key = canonical_key(own, opp)
+        if key in self.entries:
+            return False
+        self.entries[key] = value
+        return True
+
+
+    def __contains__(self, position) -> bool:
+        return canonical_key(*position) in self.entries
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+#Same API as src.reversi.reversi, the position is kept as two 64 bit integers
+class reversi:
+    def __init__(self) -> None:
+        self.set_winner = UNKNOWN
+        #player -> {(x, y): flip mask} and -player -> mask of the squares it can play on,
+        #valid until the next play
+        self.moves = {}
+
+        mid = BOARD_SIZE // 2
+        self.first = bit(mid-1, mid-1) | bit(mid, mid)
+        self.second = bit(mid-1, mid) | bit(mid, mid-1)
+
+
+    #bots assign and read `board` as a nested list, convert on the way in and out
+    @property
+    def board(self):
+        return to_board(self.first, self.second)
+
+
+    @board.setter
+    def board(self, board):
+        self.first, self.second = to_bitboards(board)
+        self.moves = {}
+
+
+    def sides(self, me):
+        if me == FIRST:
+            return self.first, self.second
+        return self.second, self.first
+
+
+    #Callers ask for many squares of the same position, the legal squares are found once
+    #(without their flips) and every question after that is a bit test. Squares off the
+    #board have no bit, so they are never legal
+    def can_move(self, x, y, me) -> bool:
+        legal = self.moves.get(-me)
+        if legal is None:
+            legal = self.legal(me)
+        return legal & SQUARES.get((x, y), 0) != 0
+
+
+    #mask of the squares a player can play on, computed once per position
+    def legal(self, me) -> int:
+        if -me not in self.moves:
+            self.moves[-me] = moves_mask(*self.sides(me))
+        return self.moves[-me]
+
+
+    #every legal move of a player with its flip mask, computed once per position
+    def get_moves(self, me) -> dict:
+        if me not in self.moves:
+            own, opp = self.sides(me)
+            mask = self.legal(me)
+            moves = {}
+            while mask:
+                move = mask & -mask
+                moves[divmod(move.bit_length() - 1, BOARD_SIZE)] = flips_mask(own, opp, move)
+                mask ^= move
+            self.moves[me] = moves
+
+        return self.moves[me]
+
+
+    def winner(self) -> int:
+        #Did a player violate the rules?
+        if self.set_winner != UNKNOWN:
+            return self.set_winner
+
+        #can the current player move? (the flips are only needed once someone plays)
+        for me in [FIRST, SECOND]:
+            if self.moves[me] if me in self.moves else self.legal(me):
+                return UNKNOWN
+
+        #count who has more squares
+        cf = self.first.bit_count()
+        cs = self.second.bit_count()
+
+        if cf > cs: return FIRST
+        if cf < cs: return SECOND
+        return TIE
+
+
+    #Returns a delta (x, y, me, flips, moves) for undo and redo, or None for an illegal
+    #move, like src.reversi.reversi.play
+    def play(self, x, y, me):
+        #squares off the board have no bit, and get no flips
+        move = SQUARES.get((x, y), 0)
+        moves = self.moves.get(me)
+        if moves is not None:
+            flips = moves.get((x, y), 0)
+        elif move and not (self.first | self.second) & move:
+            flips = flips_mask(*self.sides(me), move)
+        else:
+            flips = 0
+
+        #illegal move?
+        if not flips:
+            self.set_winner = FIRST if me == SECOND else SECOND
+            return None
+
+        delta = (x, y, me, flips, self.moves)
+        self.moves = {}
+        if me == FIRST:
+            self.first ^= move | flips
+            self.second ^= flips
+        else:
+            self.second ^= move | flips
+            self.first ^= flips
+        return delta
+
+
+    def pass_move(self, me):
+        return (-1, -1, me, 0, self.moves)
+
+
+    #take back a delta from play or pass_move, deltas are undone in reverse order
+    def undo(self, delta) -> None:
+        x, y, me, flips, moves = delta
+        if x >= 0:
+            self.apply(bit(x, y) | flips, flips, me)
+        self.moves = moves
+
+
+    def redo(self, delta) -> None:
+        x, y, me, flips, _ = delta
+        if x >= 0:
+            self.apply(bit(x, y) | flips, flips, me)
+            self.moves = {}
+
+
+    #toggle `changed` in the mover's discs and `flips` in the opponent's, which both
+    #plays and undoes a move
+    def apply(self, changed, flips, me) -> None:
+        if me == FIRST:
+            self.first ^= changed
+            self.second ^= flips
+        else:
+            self.second ^= changed
+            self.first ^= flips
+
+
+    #number of discs a player has on the board
+    def count(self, me) -> int:
+        return self.sides(me)[0].bit_count()
+
+
+    def get_board(self):
+        return to_board(self.first, self.second)
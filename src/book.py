@@ -0,0 +1,156 @@
+import os, sys, mmap, struct, argparse, time
+import src.reversi as reversi
+import src.bitboard as bitboard
+
+
+#The book is an open addressing hash table in a file, so a lookup reads one or two
+#slots of the memory map. Positions are stored from the point of view of the player
+#to move and in canonical (symmetry normalized) form
+book_path = os.path.join("static", "opening_book.bin")
+MAGIC = b"RVBK"
+HEADER = struct.Struct("<4sII")   #magic, version, slot bits
+SLOT = struct.Struct("<QQB")      #own, opp, move (bit index in the canonical frame)
+VERSION = 1
+EMPTY_SLOT = bytes(SLOT.size)
+
+
+def slot_index(own, opp, bits) -> int:
+    return (((own ^ (opp * 0x9E3779B97F4A7C15)) * 0xFF51AFD7ED558CCD) & bitboard.FULL) >> (64 - bits)
+
+
+#entries: {(own, opp): move bit index}, all canonical
+def write_book(path, entries) -> None:
+    bits = 4
+    while (1 << bits) < 2 * len(entries):
+        bits += 1
+    slots = [None] * (1 << bits)
+
+    for (own, opp), move in entries.items():
+        i = slot_index(own, opp, bits)
+        while slots[i] is not None:
+            i = (i + 1) & ((1 << bits) - 1)
+        slots[i] = SLOT.pack(own, opp, move)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, bits))
+        for s in slots:
+            f.write(EMPTY_SLOT if s is None else s)
+
+
+class opening_book:
+    def __init__(self, path : str = book_path) -> None:
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.bits = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not an opening book: " + path)
+        self.mask = (1 << self.bits) - 1
+
+
+    #best move (x, y) for the player owning `own`, or None if the position is not in the book
+    def lookup_bits(self, own, opp):
+        cown, copp, sym = bitboard.canonical(own, opp)
+        i = slot_index(cown, copp, self.bits)
+        while True:
+            sown, sopp, move = SLOT.unpack_from(self.data, HEADER.size + i * SLOT.size)
+            if sown == 0 and sopp == 0:
+                return None
+            if sown == cown and sopp == copp:
+                move = bitboard.SYMMETRIES[bitboard.INVERSE[sym]](1 << move)
+                return divmod(move.bit_length() - 1, reversi.BOARD_SIZE)
+            i = (i + 1) & self.mask
+
+
+    def lookup(self, me, board):
+        first, second = bitboard.to_bitboards(board)
+        if me == reversi.FIRST:
+            return self.lookup_bits(first, second)
+        return self.lookup_bits(second, first)
+
+
+    def __len__(self) -> int:
+        return sum(1 for i in range(self.mask + 1)
+                   if self.data[HEADER.size + i * SLOT.size:HEADER.size + (i + 1) * SLOT.size] != EMPTY_SLOT)
+
+
+    def close(self) -> None:
+        self.data.close()
+        self.file.close()
+
+
+default_book = None
+
+
+#look up a move in static/opening_book.bin, for bots. None if the book is missing
+def lookup(me, board):
+    global default_book
+    if default_book is None:
+        if not os.path.exists(book_path):
+            return None
+        default_book = opening_book(book_path)
+    return default_book.lookup(me, board)
+
+
+#canonical (own, opp) after the mover (owning `own`) plays `move`, from the next mover's point of view
+def child(own, opp, move):
+    flips = bitboard.flips_mask(own, opp, move)
+    return bitboard.canonical(opp & ~flips, own | move | flips)[:2]
+
+
+#Every position where the book side is to move in the first `plies` moves, when it
+#follows the book and the other side plays anything, for both colors.
+#best(own, opp) -> move bit index in that frame
+def build(plies, best) -> dict:
+    entries = {}
+    start = bitboard.reversi()
+    root = bitboard.canonical(start.first, start.second)[:2]
+    for book_side in [0, 1]:
+        frontier = {root}
+        for ply in range(plies):
+            children = set()
+            for own, opp in frontier:
+                if ply % 2 == book_side:
+                    if (own, opp) not in entries:
+                        entries[(own, opp)] = best(own, opp)
+                    children.add(child(own, opp, 1 << entries[(own, opp)]))
+                else:
+                    moves = bitboard.moves_mask(own, opp)
+                    while moves:
+                        move = moves & -moves
+                        moves ^= move
+                        children.add(child(own, opp, move))
+            frontier = children
+    return entries
+
+
+#search the book positions with dalit's ReversiAI and write the book
+def generate(path, plies, depth) -> None:
+    sys.path.insert(0, os.path.join("static", "unused_bots"))
+    import dalit
+
+    ai = dalit.ReversiAI()
+    ai.depth = depth
+    start = time.time()
+
+    def best(own, opp):
+        #no passes this early, so the disc count tells whose turn it is
+        me = reversi.FIRST if (own | opp).bit_count() % 2 == 0 else reversi.SECOND
+        first, second = (own, opp) if me == reversi.FIRST else (opp, own)
+        game = dalit.Reversi()
+        game.load(bitboard.to_board(first, second), me)
+        ai.table.newSearch()
+        x, y = ai.iterativeSearch(game, me)
+        return x * reversi.BOARD_SIZE + y
+
+    entries = build(plies, best)
+    write_book(path, entries)
+    print("wrote %d positions to %s in %.0f s" % (len(entries), path, time.time() - start))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the opening book with dalit's ReversiAI")
+    parser.add_argument("--plies", type=int, default=10, help="book the first PLIES moves of a game")
+    parser.add_argument("--depth", type=int, default=4, help="search depth per position")
+    parser.add_argument("--out", default=book_path)
+    args = parser.parse_args()
+    generate(args.out, args.plies, args.depth)
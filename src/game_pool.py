@@ -0,0 +1,188 @@
+import multiprocessing, threading, itertools, logging, math, time
+from collections import OrderedDict
+import src.reversi as reversi
+import src.server_utils as server_utils
+import src.sandbox as sandbox
+
+
+KEEP_FINISHED = 100   #finished games kept for viewers that come late
+
+
+#runs inside a pool process, src.reversi and server_utils are already imported
+def pool_func(tasks, results):
+    sandbox.preload()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        job_id, team, enemy, seed, size = task
+        start = time.perf_counter()
+        try:
+            res = server_utils.play_game(team, enemy, seed=seed, size=size,
+                                         on_move=lambda move: results.put(("move", job_id, move)))
+        except Exception as e:
+            res = {"error" : str(e)}
+        results.put(("done", job_id, res, time.perf_counter() - start))
+
+
+def new_job(key, on_done, size) -> dict:
+    return {"moves" : [], "result" : None, "key" : key, "size" : size, "on_done" : [on_done] if on_done else []}
+
+
+#A fixed set of pre-forked game processes with a bounded queue in front of them
+class game_pool:
+    def __init__(self, size : int, max_queue : int) -> None:
+        self.size = size
+        self.max_queue = max_queue
+        self.procs = []
+        self.tasks = None
+        self.results = None
+        self.collector = None
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)   #notified on every move and finished game
+        self.ids = itertools.count()
+        self.pending = {}   #job id -> job, queued or running
+        self.finished = OrderedDict()   #job id -> job, until it is waited for or pushed out
+        self.running = {}   #game key -> job id, so viewers of the same game share it
+        self.avg_time = 1.0
+
+
+    def start(self) -> None:
+        with self.lock:
+            if self.procs:
+                return
+
+            self.tasks = multiprocessing.Queue()
+            self.results = multiprocessing.Queue()
+            for _ in range(self.size):
+                p = multiprocessing.Process(target=pool_func, args=(self.tasks, self.results))
+                p.start()
+                self.procs.append(p)
+
+            self.collector = threading.Thread(target=self.collect, daemon=True)
+            self.collector.start()
+
+
+    #hand moves and finished games back to the threads waiting on them
+    def collect(self) -> None:
+        while True:
+            msg = self.results.get()
+            if msg is None:
+                break
+
+            if msg[0] == "move":
+                _, job_id, move = msg
+                with self.lock:
+                    self.pending[job_id]["moves"].append(move)
+                    self.changed.notify_all()
+                continue
+
+            _, job_id, res, took = msg
+            with self.lock:
+                self.avg_time = 0.9 * self.avg_time + 0.1 * took
+                job = self.pending.pop(job_id)
+                job["result"] = res
+                self.running.pop(job["key"], None)
+
+                self.finished[job_id] = job
+                while len(self.finished) > max(KEEP_FINISHED, self.max_queue):
+                    self.finished.popitem(last=False)
+                self.changed.notify_all()
+
+            #this thread serves every game, one failing callback must not stop it
+            for f in job["on_done"]:
+                try:
+                    f(res)
+                except Exception:
+                    logging.exception("on_done callback of game %d failed", job_id)
+
+
+    def depth(self) -> int:
+        return len(self.pending)
+
+
+    #seconds until a slot is likely to free up
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.avg_time * self.depth() / self.size))
+
+
+    #Returns a job id, or None when the queue is full. Games with the same key are
+    #played once: a second submit while the first is running gets the same job id.
+    #on_done(result) is called once, from the collector thread
+    def submit(self, team, enemy, seed=None, key=None, on_done=None, size=reversi.BOARD_SIZE):
+        self.start()
+        with self.lock:
+            if key is not None and key in self.running:
+                return self.running[key]
+            if len(self.pending) >= self.max_queue:
+                return None
+
+            job_id = next(self.ids)
+            self.pending[job_id] = new_job(key, on_done, size)
+            if key is not None:
+                self.running[key] = job_id
+
+        self.tasks.put((job_id, team, enemy, seed, size))
+        return job_id
+
+
+    #call f(result) when a job finishes (right away if it already has)
+    def add_done(self, job_id, f) -> None:
+        with self.lock:
+            job = self.find(job_id)
+            if job["result"] is None:
+                job["on_done"].append(f)
+                return
+        f(job["result"])
+
+
+    def find(self, job_id):
+        return self.pending.get(job_id) or self.finished.get(job_id)
+
+
+    def wait(self, job_id):
+        with self.lock:
+            job = self.find(job_id)
+            while job["result"] is None:
+                self.changed.wait()
+            self.finished.pop(job_id, None)
+            return job["result"]
+
+
+    #Yields the moves of a job as they are played, from the first one, and returns the
+    #result (StopIteration.value). KeyError for a job that is unknown or long finished
+    def follow(self, job_id):
+        with self.lock:
+            job = self.find(job_id)
+        if job is None:
+            raise KeyError(job_id)
+
+        sent = 0
+        while True:
+            with self.lock:
+                while sent == len(job["moves"]) and job["result"] is None:
+                    self.changed.wait()
+                moves = job["moves"][sent:]
+                res = job["result"]
+
+            for move in moves:
+                yield move
+            sent += len(moves)
+            if res is not None and sent == len(job["moves"]):
+                return res
+
+
+    def close(self) -> None:
+        with self.lock:
+            procs, self.procs = self.procs, []
+        if not procs:
+            return
+
+        for _ in procs:
+            self.tasks.put(None)
+        for p in procs:
+            p.join()
+        self.results.put(None)
+        self.collector.join()
@@ -0,0 +1,94 @@
+import os, json, sqlite3, time
+import src.server_utils as server_utils
+
+
+#Games and tournaments asked for through the job API. They are kept in sqlite, so
+#a restarted server picks up the queued ones and still serves the finished ones
+db_path = os.path.join(server_utils.basedir, "jobs.db")
+
+
+def connect():
+    if not os.path.exists(server_utils.basedir):
+        os.makedirs(server_utils.basedir)
+
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, kind TEXT, args TEXT, status TEXT, "
+               "result TEXT, submitted_at REAL, finished_at REAL)")
+    return db
+
+
+#kind is "game" (args: team, enemy, seed, size, replay: skip the result cache) or "tournament" (no args)
+def add(kind, args) -> int:
+    db = connect()
+    try:
+        cur = db.execute("INSERT INTO jobs (kind, args, status, submitted_at) VALUES (?, ?, 'queued', ?)",
+                         (kind, json.dumps(args), time.time()))
+        db.commit()
+        return cur.lastrowid
+    finally:
+        db.close()
+
+
+#mark a queued job as handed out, False when it is not queued anymore (finished, or
+#already running)
+def start(job_id) -> bool:
+    db = connect()
+    try:
+        cur = db.execute("UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'", (job_id,))
+        db.commit()
+        return cur.rowcount == 1
+    finally:
+        db.close()
+
+
+#put a running job back in the queue, or every running job when job_id is None (at
+#startup, for the jobs a previous run of the server did not finish)
+def requeue(job_id=None) -> None:
+    db = connect()
+    try:
+        if job_id is None:
+            db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        else:
+            db.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'", (job_id,))
+        db.commit()
+    finally:
+        db.close()
+
+
+def finish(job_id, result) -> None:
+    status = "error" if "error" in result else "done"
+    db = connect()
+    try:
+        db.execute("UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                   (status, json.dumps(result), time.time(), job_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def get(job_id):
+    db = connect()
+    try:
+        row = db.execute("SELECT id, kind, args, status, result, submitted_at, finished_at FROM jobs WHERE id = ?",
+                         (job_id,)).fetchone()
+    finally:
+        db.close()
+    if row is None:
+        return None
+
+    job_id, kind, args, status, result, submitted_at, finished_at = row
+    job = {"id" : job_id, "kind" : kind, "args" : json.loads(args), "status" : status,
+           "submitted_at" : submitted_at, "finished_at" : finished_at}
+    if result is not None:
+        job["result"] = json.loads(result)
+    return job
+
+
+#[(id, kind, args)] of every job that waits to be handed out, oldest first
+def unfinished() -> list:
+    db = connect()
+    try:
+        rows = db.execute("SELECT id, kind, args FROM jobs WHERE status = 'queued' ORDER BY id").fetchall()
+    finally:
+        db.close()
+    return [(job_id, kind, json.loads(args)) for job_id, kind, args in rows]
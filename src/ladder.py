@@ -0,0 +1,106 @@
+import os, random, sqlite3, time
+import src.reversi as reversi
+import src.server_utils as server_utils
+import src.tournament as tournament
+
+
+START_RATING = 1500.0
+K = 32
+SAMPLE = 10   #opponents replayed when a bot is resubmitted
+db_path = os.path.join(server_utils.basedir, "ladder.db")
+
+
+def connect():
+    if not os.path.exists(server_utils.basedir):
+        os.makedirs(server_utils.basedir)
+
+    db = sqlite3.connect(db_path, timeout=30)
+    db.execute("CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, team TEXT, enemy TEXT, "
+               "team_version INTEGER, enemy_version INTEGER, winner INTEGER, discs_first INTEGER, "
+               "discs_second INTEGER, played_at REAL)")
+    db.execute("CREATE TABLE IF NOT EXISTS ratings (bot TEXT PRIMARY KEY, rating REAL, games INTEGER, version INTEGER)")
+    return db
+
+
+def get_row(db, bot):
+    row = db.execute("SELECT rating, games, version FROM ratings WHERE bot = ?", (bot,)).fetchone()
+    if row is None:
+        row = (START_RATING, 0, 0)
+        db.execute("INSERT INTO ratings VALUES (?, ?, ?, ?)", (bot,) + row)
+    return row
+
+
+#1 for a first player win, 0 for a loss, 0.5 for a tie (crashes count as losses)
+def first_score(winner) -> float:
+    if winner in [reversi.FIRST, -2]:
+        return 1.0
+    if winner in [reversi.SECOND, -1]:
+        return 0.0
+    return 0.5
+
+
+def expected(ra, rb) -> float:
+    return 1 / (1 + 10 ** ((rb - ra) / 400))
+
+
+#store one play_game result and move both ratings by it
+def record(db, team, enemy, res) -> None:
+    ra, ga, va = get_row(db, team)
+    rb, gb, vb = get_row(db, enemy)
+    cf, cs = res.get("discs", [0, 0])
+    db.execute("INSERT INTO games (team, enemy, team_version, enemy_version, winner, discs_first, discs_second, played_at) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (team, enemy, va, vb, res["winner"], cf, cs, time.time()))
+
+    if team == enemy:
+        return
+    s = first_score(res["winner"])
+    e = expected(ra, rb)
+    db.execute("UPDATE ratings SET rating = ?, games = ? WHERE bot = ?", (ra + K * (s - e), ga + 1, team))
+    db.execute("UPDATE ratings SET rating = ?, games = ? WHERE bot = ?", (rb + K * (e - s), gb + 1, enemy))
+
+
+#a play_game hook: every finished game moves the ratings, wherever it was played
+def record_game(team, enemy, seed, res) -> None:
+    if "error" in res:
+        return
+
+    db = connect()
+    try:
+        #take the write lock before reading the ratings, or two processes rating the same
+        #bot both read the old rating and one update is lost
+        db.execute("BEGIN IMMEDIATE")
+        record(db, team, enemy, res)
+        db.commit()
+    finally:
+        db.close()
+
+
+#A bot got new code: reset it, and return the games (team, enemy) that replay it against
+#a sample of opponents. The caller queues them like any other game, record_game rates them
+def resubmitted(bot, sample=SAMPLE) -> list:
+    db = connect()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        _, _, version = get_row(db, bot)
+        db.execute("UPDATE ratings SET rating = ?, games = 0, version = ? WHERE bot = ?", (START_RATING, version + 1, bot))
+        db.commit()
+    finally:
+        db.close()
+
+    others = [b for b in tournament.list_bots() if b != bot]
+    opponents = random.sample(others, min(sample, len(others)))
+    return [pair for other in opponents for pair in [(bot, other), (other, bot)]]
+
+
+def standings() -> list:
+    db = connect()
+    try:
+        rows = db.execute("SELECT bot, rating, games FROM ratings ORDER BY rating DESC").fetchall()
+    finally:
+        db.close()
+    return [{"bot" : b, "rating" : round(r, 1), "games" : g} for b, r, g in rows]
+
+
+if __name__ == "__main__":
+    for i, r in enumerate(standings()):
+        print("%-4d %-20s %7.1f %6d" % (i + 1, r["bot"], r["rating"], r["games"]))
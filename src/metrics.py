@@ -0,0 +1,83 @@
+import threading
+
+
+#upper bounds of the histogram buckets
+SECONDS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.7, 1.0]
+BYTES_BUCKETS = [2 ** 20 * m for m in [16, 32, 64, 128, 256, 512, 1024, 2048]]
+
+
+class histogram:
+    def __init__(self, name : str, help : str, buckets : list) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+
+    def observe(self, value) -> None:
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+    def render(self) -> list:
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        for b, c in zip(self.buckets, self.counts):
+            lines.append('%s_bucket{le="%g"} %d' % (self.name, b, c))
+        lines.append('%s_bucket{le="+Inf"} %d' % (self.name, self.total))
+        lines.append("%s_sum %g" % (self.name, self.sum))
+        lines.append("%s_count %d" % (self.name, self.total))
+        return lines
+
+
+#Counters and histograms over finished games, rendered in the prometheus text format
+class registry:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters = {
+            "reversi_games_total" : [0, "Games played"],
+            "reversi_moves_total" : [0, "Moves asked from bots"],
+            "reversi_forfeits_total" : [0, "Games lost by a crash or a timeout"],
+            "reversi_spawns_total" : [0, "Bot workers started"],
+        }
+        self.histograms = [
+            histogram("reversi_move_spawn_seconds", "Time to start a bot worker", SECONDS_BUCKETS),
+            histogram("reversi_move_compute_seconds", "Time spent in get_move", SECONDS_BUCKETS),
+            histogram("reversi_move_cpu_seconds", "Cpu time the bot's processes used for a move", SECONDS_BUCKETS),
+            histogram("reversi_move_ipc_seconds", "Round trip time minus get_move", SECONDS_BUCKETS),
+            histogram("reversi_bot_peak_rss_bytes", "Peak RSS of the bot worker after a move", BYTES_BUCKETS),
+        ]
+
+
+    def observe_game(self, res) -> None:
+        spawn, compute, cpu, ipc, rss = self.histograms
+        with self.lock:
+            self.counters["reversi_games_total"][0] += 1
+            if res["winner"] < 0:
+                self.counters["reversi_forfeits_total"][0] += 1
+
+            for t in res.get("timings", []):
+                self.counters["reversi_moves_total"][0] += 1
+                if t["spawn"]:
+                    self.counters["reversi_spawns_total"][0] += 1
+                    spawn.observe(t["spawn"])
+                if t["compute"] is not None:
+                    compute.observe(t["compute"])
+                    if t.get("cpu") is not None:
+                        cpu.observe(t["cpu"])
+                    ipc.observe(t["ipc"])
+                    rss.observe(t["rss"])
+
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, (value, help) in self.counters.items():
+                lines += ["# HELP %s %s" % (name, help), "# TYPE %s counter" % name, "%s %d" % (name, value)]
+            for h in self.histograms:
+                lines += h.render()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,69 @@
+import hashlib, re, threading
+from collections import OrderedDict
+import src.reversi as reversi
+import src.server_utils as server_utils
+
+
+MAX_ENTRIES = 10000
+#bots that read the clock (iterative deepening against a deadline, like dalit) can play
+#a different game from the same seed, caching one of their games would pin it
+USES_CLOCK = re.compile(r"^\s*(import\s[^\n]*\btime\b|from\s+time\s+import)", re.M)
+
+
+def uses_clock(passcode : str) -> bool:
+    with open(server_utils.pass_to_pyfile_path(passcode)) as f:
+        return USES_CLOCK.search(f.read()) is not None
+
+
+def source_hash(passcode : str) -> str:
+    with open(server_utils.pass_to_pyfile_path(passcode), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+#Finished games keyed by the bots' source, so identical matchups are not replayed
+class result_cache:
+    def __init__(self, max_entries : int = MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   #key -> (team, enemy, play_game result)
+        self.lock = threading.Lock()
+        server_utils.save_hooks.append(self.invalidate)
+
+
+    def key(self, team, enemy, seed, size=reversi.BOARD_SIZE):
+        return (source_hash(team), source_hash(enemy), server_utils.ENGINE_VERSION, seed, size)
+
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][2]
+
+
+    def put(self, key, team, enemy, res) -> None:
+        #timeouts depend on load, a crashed game is not worth replaying from cache
+        if "error" in res or res["winner"] < 0:
+            return
+        if uses_clock(team) or uses_clock(enemy):
+            return
+
+        #the per move timings are most of a result and a replay does not show them
+        res = {k : v for k, v in res.items() if k != "timings"}
+        with self.lock:
+            self.entries[key] = (team, enemy, res)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+    #drop every entry of a bot that was just overwritten
+    def invalidate(self, passcode : str) -> None:
+        with self.lock:
+            for key, (team, enemy, _) in list(self.entries.items()):
+                if passcode in [team, enemy]:
+                    del self.entries[key]
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
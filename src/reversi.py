@@ -7,64 +7,140 @@ TIE = 3
 BOARD_SIZE = 8
 
 
+#For every square of a size x size board, the squares in each of the 8 directions
+#out to the edge as (x, y, bit), bit being 1 << (x * size + y). Directions with
+#fewer than two squares can never flip anything and are left out
+RAYS = {}
+
+
+def rays(size : int):
+    if size not in RAYS:
+        table = []
+        for x in range(size):
+            row = []
+            for y in range(size):
+                square = []
+                for dx in [-1, 0, 1]:
+                    for dy in [-1, 0, 1]:
+                        ray = []
+                        xx, yy = x + dx, y + dy
+                        while (dx or dy) and 0 <= xx < size and 0 <= yy < size:
+                            ray.append((xx, yy, 1 << (xx * size + yy)))
+                            xx += dx
+                            yy += dy
+                        if len(ray) > 1:
+                            square.append(tuple(ray))
+                row.append(tuple(square))
+            table.append(row)
+        RAYS[size] = table
+    return RAYS[size]
+
+
 class reversi:
-    def __init__(self) -> None:
-        self.board = [[UNKNOWN for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)] 
+    def __init__(self, size : int = BOARD_SIZE) -> None:
+        if size < 4 or size % 2:
+            raise ValueError("Board size must be even and at least 4")
+        self.size = size
+        self.rays = rays(size)
+        self.squares = [[UNKNOWN for _ in range(size)] for _ in range(size)] 
         self.set_winner = UNKNOWN
+        #player -> {(x, y): flip mask}, valid until the next play
+        self.moves = {}
+
+        mid = size // 2
+        self.squares[mid-1][mid-1] = self.squares[mid][mid] = FIRST
+        self.squares[mid-1][mid] = self.squares[mid][mid-1] = SECOND
+
 
-        mid = BOARD_SIZE // 2
-        self.board[mid-1][mid-1] = self.board[mid][mid] = FIRST
-        self.board[mid-1][mid] = self.board[mid][mid-1] = SECOND
+    #bots assign `board` to load a position, the cached moves belong to the old one
+    @property
+    def board(self):
+        return self.squares
+
+
+    @board.setter
+    def board(self, board):
+        self.squares = board
+        self.moves = {}
 
 
     def can_move(self, x, y, me) -> bool: 
         #illegal move? 
-        if x < 0 or x >= BOARD_SIZE: 
+        if x < 0 or x >= self.size: 
             return False 
-        if y < 0 or y >= BOARD_SIZE: 
+        if y < 0 or y >= self.size: 
             return False 
-        if self.board[x][y] != UNKNOWN: 
+        if self.squares[x][y] != UNKNOWN: 
             return False
-
-        for dx in [-1, 0, 1]: 
-            for dy in [-1, 0, 1]: 
-                if dx == 0 and dy == 0: 
-                    continue
-            
-                #find next in direction... 
-                xx = x + dx
-                yy = y + dy
-                while (0 <= xx < BOARD_SIZE) and (0 <= yy < BOARD_SIZE): 
-                    #Wasn't assigned 
-                    if self.board[xx][yy] == UNKNOWN: 
-                        break 
-
-                    #found a line to reverse
-                    if self.board[xx][yy] == me: 
-                        if (abs(xx - x) > 1 or abs(yy - y) > 1):
-                            return True 
-                        break 
-
-                    xx += dx
-                    yy += dy
+        if me in self.moves: 
+            return (x, y) in self.moves[me]
+
+        board = self.squares
+        for ray in self.rays[x][y]: 
+            #the neighbour has to be the opponent's...
+            xx, yy, _ = ray[0]
+            if board[xx][yy] in (UNKNOWN, me): 
+                continue
+
+            #...and the line has to end with one of ours
+            for xx, yy, _ in ray: 
+                v = board[xx][yy]
+                if v == me: 
+                    return True
+                if v == UNKNOWN: 
+                    break
 
         return False 
 
 
+    #the squares flipped by playing (x, y), as a mask with bit x * size + y
+    def flips(self, x, y, me) -> int: 
+        board = self.squares
+        flips = 0
+        for ray in self.rays[x][y]: 
+            line = 0
+            for xx, yy, b in ray: 
+                v = board[xx][yy]
+                if v == UNKNOWN: 
+                    break 
+
+                if v == me: 
+                    flips |= line
+                    break 
+
+                line |= b
+
+        return flips
+
+
+    #every legal move of a player with its flip mask, computed once per position
+    def get_moves(self, me) -> dict: 
+        if me not in self.moves: 
+            moves = {}
+            for i in range(self.size): 
+                for j in range(self.size): 
+                    if self.squares[i][j] != UNKNOWN: 
+                        continue
+                    flips = self.flips(i, j, me)
+                    if flips: 
+                        moves[(i, j)] = flips
+            self.moves[me] = moves
+
+        return self.moves[me]
+
+
     def winner(self) -> int: 
         #Did a player violate the rules? 
         if self.set_winner != UNKNOWN: 
             return self.set_winner
         
         #can the current player move? 
-        for i in range(BOARD_SIZE): 
-            for j in range(BOARD_SIZE): 
-                if self.can_move(i, j, FIRST): return UNKNOWN
-                if self.can_move(i, j, SECOND): return UNKNOWN
+        if self.get_moves(FIRST) or self.get_moves(SECOND): 
+            return UNKNOWN
         
         #count who has more squares
         cf = cs = 0
-        for l in self.board: 
+        for l in self.squares: 
             for v in l:
                 if v == FIRST: 
                     cf += 1
@@ -76,37 +152,62 @@ class reversi:
         return TIE 
             
 
-    def play(self, x, y, me) -> None: 
+    #Returns a delta (x, y, me, flips, moves) for undo and redo, or None for an illegal
+    #move, which ends the game and is not undone
+    def play(self, x, y, me): 
         #illegal move? 
         if not self.can_move(x, y, me): 
             self.set_winner = FIRST if me == SECOND else SECOND
-            return 
+            return None
 
-        self.board[x][y] = me
-        for dx in [-1, 0, 1]: 
-            for dy in [-1, 0, 1]: 
-                if dx == 0 and dy == 0: 
-                    continue
-            
-                #find next in direction... 
-                xx = x + dx
-                yy = y + dy
-                while (0 <= xx < BOARD_SIZE) and (0 <= yy < BOARD_SIZE): 
-                    #Wasn't assigned 
-                    if self.board[xx][yy] == UNKNOWN: 
-                        break 
-
-                    #found a line to reverse
-                    if self.board[xx][yy] == me: 
-                        while (xx != x or yy != y):
-                            self.board[xx][yy] = me
-                            xx -= dx
-                            yy -= dy 
-                        break
-
-                    xx += dx
-                    yy += dy
+        flips = self.moves.get(me, {}).get((x, y)) or self.flips(x, y, me)
+        delta = (x, y, me, flips, self.moves)
+        self.moves = {}
+
+        self.squares[x][y] = me
+        self.set_squares(flips, me)
+        return delta
+
+
+    #The null move: `me` passes. The board does not change, but the delta lets a
+    #search treat a pass like any other move
+    def pass_move(self, me): 
+        return (-1, -1, me, 0, self.moves)
+
+
+    #take back the move of a delta from play or pass_move, in O(flips).
+    #Deltas have to be undone in the reverse order they were played
+    def undo(self, delta) -> None: 
+        x, y, me, flips, moves = delta
+        if x >= 0: 
+            self.squares[x][y] = UNKNOWN
+            self.set_squares(flips, FIRST if me == SECOND else SECOND)
+        #the moves of the position before, if they were computed
+        self.moves = moves
+
+
+    #play an undone delta again, without looking for the flips
+    def redo(self, delta) -> None: 
+        x, y, me, flips, _ = delta
+        if x >= 0: 
+            self.squares[x][y] = me
+            self.set_squares(flips, me)
+            self.moves = {}
+
+
+    #set every square of a mask to `v`
+    def set_squares(self, mask, v) -> None: 
+        while mask: 
+            low = mask & -mask
+            xx, yy = divmod(low.bit_length() - 1, self.size)
+            self.squares[xx][yy] = v
+            mask ^= low
+
+
+    #number of discs a player has on the board
+    def count(self, me) -> int: 
+        return sum(l.count(me) for l in self.squares)
 
 
     def get_board(self):  
-        return copy.deepcopy(self.board)
\ No newline at end of file
+        return copy.deepcopy(self.squares)
\ No newline at end of file
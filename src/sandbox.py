@@ -0,0 +1,342 @@
+import ctypes, importlib, multiprocessing, os, random, resource, signal, threading, time
+import src.bitboard as bitboard
+
+
+#Heavy trusted modules that bots import. Processes that start workers import them once,
+#and the forked workers inherit them instead of importing them on every start
+PRELOAD = ["numpy", "src.book"]
+
+
+#Limits of a bot. They count the worker and every process it starts together (its
+#tree, see walk), memory is on top of what the worker has resident when it starts (its
+#share of the preloaded modules) and cpu is per move. A move may take up to WALL_FACTOR
+#times its cpu budget in wall time, so a loaded box does not cost bots their moves while
+#a bot that sleeps or blocks is still stopped
+MEMORY_LIMIT = 512 * 1024 * 1024
+WALL_FACTOR = 3
+CPU_CHECK = 0.05   #seconds between looks at the usage of a bot that is still thinking
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = resource.getpagesize()
+PR_SET_CHILD_SUBREAPER = 36
+
+#pids of the bot processes this process started and has not reaped yet. Any other child
+#outside this process' session is an orphan a bot left behind (see kill_orphans)
+roots = set()
+roots_lock = threading.Lock()
+subreaper_pid = None   #the process that is a subreaper, forks do not inherit it
+
+
+def preload() -> None:
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+#Runs first in every bot process: a session of its own and a cap on the address space
+#of each of its processes. The address space is read from /proc, elsewhere only the
+#session is set up
+def limit_resources() -> None:
+    os.setsid()
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    try:
+        with open("/proc/self/statm") as f:
+            mapped = int(f.read().split()[0]) * PAGE_SIZE
+    except OSError:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (mapped + MEMORY_LIMIT, mapped + MEMORY_LIMIT))
+
+
+#Processes a bot detaches (setsid, a double fork) become children of this process
+#instead of init's, so they can not leave the bot's tree unnoticed. Linux only
+def become_subreaper() -> None:
+    global subreaper_pid
+    if subreaper_pid == os.getpid():
+        return
+    subreaper_pid = os.getpid()
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+
+#start a bot process (its target calls limit_resources first) and remember it as ours
+def spawn(proc) -> None:
+    with roots_lock:
+        become_subreaper()
+        proc.start()
+        roots.add(proc.pid)
+
+
+#bytes resident in this process
+def resident_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return 0
+
+
+#The fields of /proc/<pid>/stat after the ")" that closes the command name (state is
+#0, ppid 1, session 3, utime..cstime 11-14, rss 21), None once the process is gone
+def stat(pid):
+    try:
+        with open("/proc/%d/stat" % pid, "rb") as f:
+            return f.read().rsplit(b")", 1)[1].split()
+    except OSError:
+        return None
+
+
+#children of a process, forked from any of its threads
+def children(pid) -> list:
+    try:
+        tids = os.listdir("/proc/%d/task" % pid)
+    except OSError:
+        return []
+    pids = []
+    for tid in tids:
+        try:
+            with open("/proc/%d/task/%s/children" % (pid, tid)) as f:
+                pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+#{pid: stat fields} of a bot process and everything below it. Nothing below it can get
+#out: a process whose parent dies goes to this process (a subreaper), which kills it
+def walk(root) -> dict:
+    found = {}
+    todo = [root]
+    while todo:
+        pid = todo.pop()
+        fields = None if pid in found else stat(pid)
+        if fields is None:
+            continue
+        found[pid] = fields
+        todo.extend(children(pid))
+    return found
+
+
+#Kill and reap every child of this process that is not one of its bot processes and
+#that left this process' session: a process a bot detached, whose parent is gone.
+#Orphans are only reparented to the main thread. Returns their pids
+def kill_orphans() -> list:
+    me = os.getpid()
+    try:
+        with open("/proc/%d/task/%d/children" % (me, me)) as f:
+            pids = [int(c) for c in f.read().split()]
+    except OSError:
+        return []
+
+    with roots_lock:
+        pids = [pid for pid in pids if pid not in roots]
+        if not pids:
+            return []
+        #processes this one started in any other way (e.g. a game pool) are left alone
+        known = {p.pid for p in multiprocessing.active_children()}
+        sid = os.getsid(0)
+        orphans = []
+        for pid in pids:
+            fields = stat(pid)
+            if pid in known or fields is None or int(fields[3]) == sid:
+                continue
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            orphans.append(pid)
+    return orphans
+
+
+#wait until none of `pids` runs anymore (they exited or are zombies)
+def wait_dead(pids) -> None:
+    for pid in pids:
+        fields = stat(pid)
+        while fields is not None and fields[0] != b"Z":
+            time.sleep(0.001)
+            fields = stat(pid)
+
+
+#Kill a bot process and everything it started, then wait for it. Safe to call on any
+#path: on a process that already exited, or one that had no time to set up its session
+def reap(proc) -> None:
+    try:
+        #the process is not waited for yet, so its id can not have been reused
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+    pids = [pid for pid in walk(proc.pid) if pid != proc.pid]
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    proc.kill()
+    proc.join()
+    with roots_lock:
+        roots.discard(proc.pid)
+
+    #the processes killed above (or the whole tree, when the worker had exited already)
+    #pass their children to this one as they die, then those are killed too, until none
+    #is left
+    while True:
+        wait_dead(pids)
+        pids = kill_orphans()
+        if not pids:
+            break
+
+
+#runs inside the worker: import the bot once, then answer moves until told to stop.
+#boards arrive as two bitboards and the board size, the nested list is only built for
+#bots that want one (get_move_bitboard is only for 8x8 boards)
+def worker_func(team, seed, conn):
+    limit_resources()
+    start = time.perf_counter()
+    team = __import__(team)
+    if seed is not None:
+        random.seed(seed)
+    conn.send(time.perf_counter() - start)
+
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+
+        me, first, second, size = msg
+        start = time.perf_counter()
+        if size == bitboard.BOARD_SIZE and hasattr(team, "get_move_bitboard"):
+            x, y = team.get_move_bitboard(me, first, second)
+        else:
+            x, y = team.get_move(me, bitboard.to_board(first, second, size))
+        compute = time.perf_counter() - start
+        #ru_maxrss is in kilobytes on linux
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        conn.send((x, y, compute, rss))
+
+
+#A bot process that lives for a whole game (or several), moves go over a pipe.
+#timeout is the cpu seconds a move (or the import) may use
+class bot_worker:
+    def __init__(self, team : str, timeout : float, seed=None) -> None:
+        self.team = team
+        self.timeout = timeout
+        self.seed = seed
+        self.proc = None
+        self.conn = None
+        self.import_seconds = None
+        self.tree = {}            #pid -> (ppid, cpu ticks) of the bot's processes at the last look
+        self.gone_ticks = 0       #cpu ticks of the processes that are gone since, not waited for in the tree
+        self.cpu_total = 0.0      #cpu seconds of the whole tree at the last look
+        self.memory_limit = None  #resident bytes the tree may reach
+        #timings of the last move: spawn, compute, cpu and ipc seconds, peak rss in bytes
+        self.stats = {}
+
+
+    def start(self) -> None:
+        self.tree = {}
+        self.gone_ticks = 0
+        self.cpu_total = 0.0
+        self.memory_limit = resident_bytes() + MEMORY_LIMIT
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=worker_func, args=(self.team, self.seed, child_conn), daemon=True)
+        spawn(self.proc)
+        child_conn.close()
+
+        #importing the bot gets the same budget as a move, counted from the fork
+        self.wait()
+        self.import_seconds = self.conn.recv()
+
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.is_alive()
+
+
+    #(cpu seconds, resident bytes) of the worker and everything below it, None without
+    #/proc. A process that is gone counts with the cpu it had at the last look, unless
+    #its parent in the tree is still there (then it waited for it and has its cpu)
+    def usage(self):
+        kill_orphans()
+        found = walk(self.proc.pid)
+        if not found:
+            return None
+
+        for pid, (ppid, ticks) in self.tree.items():
+            if pid not in found and ppid not in found:
+                self.gone_ticks += ticks
+        self.tree = {pid : (int(f[1]), int(f[11]) + int(f[12]) + int(f[13]) + int(f[14])) for pid, f in found.items()}
+        ticks = self.gone_ticks + sum(t for _, t in self.tree.values())
+        return ticks / CLOCK_TICKS, sum(int(f[21]) for f in found.values()) * PAGE_SIZE
+
+
+    #Wait for an answer, kill the worker if it runs over its limits. The wall clock only
+    #stops bots that do not compute, the cpu the tree used since the last look decides
+    #the rest, so processes the bot left running between moves count against its next
+    #one. Returns those cpu seconds (None when they can not be read)
+    def wait(self):
+        deadline = time.perf_counter() + self.timeout * WALL_FACTOR
+        while True:
+            ready = self.conn.poll(min(CPU_CHECK, max(0.0, deadline - time.perf_counter())))
+            usage = self.usage()
+            cpu = None
+            if usage is not None:
+                cpu = max(0.0, usage[0] - self.cpu_total)
+                if cpu > self.timeout:
+                    self.kill()
+                    raise TimeoutError(self.team + " ran out of cpu time")
+                if usage[1] > self.memory_limit:
+                    self.kill()
+                    raise MemoryError(self.team + " used too much memory")
+            if ready:
+                if usage is not None:
+                    self.cpu_total = usage[0]
+                return cpu
+            if time.perf_counter() >= deadline:
+                self.kill()
+                raise TimeoutError(self.team + " ran out of time")
+
+
+    #first, second: the bitboards of the position (see src.bitboard.to_bitboards)
+    def get_move(self, me, first, second, size=bitboard.BOARD_SIZE):
+        self.stats = {"spawn" : 0.0, "compute" : None, "cpu" : None, "ipc" : None, "rss" : None}
+        try:
+            if not self.alive():
+                start = time.perf_counter()
+                self.start()
+                self.stats["spawn"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self.conn.send((me, first, second, size))
+            cpu = self.wait()
+            x, y, compute, rss = self.conn.recv()
+            took = time.perf_counter() - start
+        except:
+            #crashed or timed out, the next move starts a fresh worker
+            self.kill()
+            raise
+
+        self.stats.update(compute=compute, cpu=cpu, ipc=max(0.0, took - compute), rss=rss)
+        return x, y
+
+
+    def kill(self) -> None:
+        if self.proc is not None:
+            reap(self.proc)
+            self.conn.close()
+        self.proc = None
+        self.conn = None
+
+
+    #ask the worker to exit, then reap it and whatever it left behind
+    def close(self) -> None:
+        if self.alive():
+            try:
+                self.conn.send(None)
+                #poll returns once the worker has exited and closed its end
+                self.conn.poll(self.timeout)
+            except OSError:
+                pass
+        self.kill()
@@ -0,0 +1,231 @@
+import argparse, csv, importlib.util, os, random, time
+import numpy as np
+import src.reversi as reversi
+import src.bitboard as bitboard
+
+
+#Trusted self-play: no sandbox and no Submitted Code, every game of a batch is
+#stepped together on arrays of bitboards (one uint64 per board and color)
+BATCH = 10000
+ONE = np.uint64(1)
+DIRECTIONS = [(np.uint64(s), np.uint64(mask)) for s, mask in bitboard.DIRECTIONS]
+
+#squares by distance to the nearest corner, what lessNaiveBot ranks moves by
+RINGS = [np.uint64(sum(bitboard.bit(x, y) for x in range(reversi.BOARD_SIZE) for y in range(reversi.BOARD_SIZE)
+                       if min(x, reversi.BOARD_SIZE - 1 - x) + min(y, reversi.BOARD_SIZE - 1 - y) == d))
+         for d in range(reversi.BOARD_SIZE)]
+
+
+def popcount(b):
+    b = b - ((b >> ONE) & np.uint64(0x5555555555555555))
+    b = (b & np.uint64(0x3333333333333333)) + ((b >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    b = (b + (b >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((b * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def lowest_bit(b):
+    return b & (~b + ONE)
+
+
+#bitboard.moves_mask on every board at once
+def moves_mask(own, opp):
+    empty = ~(own | opp)
+    moves = np.zeros_like(own)
+    for s, mask in DIRECTIONS:
+        o = opp & mask
+
+        t = o & (own << s)
+        for _ in range(5):
+            t |= o & (t << s)
+        moves |= empty & (t << s)
+
+        t = o & (own >> s)
+        for _ in range(5):
+            t |= o & (t >> s)
+        moves |= empty & (t >> s)
+    return moves
+
+
+#bitboard.flips_mask on every board at once, a run only counts if an own disc closes it
+def flips_mask(own, opp, move):
+    flips = np.zeros_like(own)
+    for s, mask in DIRECTIONS:
+        o = opp & mask
+
+        line = t = o & (move << s)
+        for _ in range(5):
+            t = o & (t << s)
+            line |= t
+        flips |= np.where(own & (line << s) & ~line, line, 0).astype(np.uint64)
+
+        line = t = o & (move >> s)
+        for _ in range(5):
+            t = o & (t >> s)
+            line |= t
+        flips |= np.where(own & (line >> s) & ~line, line, 0).astype(np.uint64)
+    return flips
+
+
+#a uniformly random set bit of every mask (0 stays 0)
+def random_bit(masks, rng):
+    skip = (rng.random(len(masks)) * popcount(masks)).astype(np.int64)
+    while True:
+        active = skip > 0
+        if not active.any():
+            return lowest_bit(masks)
+        masks = np.where(active, masks & (masks - ONE), masks)
+        skip -= active
+
+
+#Policies pick one move per board: policy(me, own, opp, moves, rng) -> array of move bits.
+#`moves` is never 0, boards that have to pass are not asked
+def random_policy(me, own, opp, moves, rng):
+    return random_bit(moves, rng)
+
+
+#naiveBot: the first legal move in (x, y) order
+def first_policy(me, own, opp, moves, rng):
+    return lowest_bit(moves)
+
+
+#lessNaiveBot: a random one of the moves closest to a corner
+def corner_policy(me, own, opp, moves, rng):
+    best = np.zeros_like(moves)
+    for ring in RINGS:
+        best = np.where(best == 0, moves & ring, best)
+    return random_bit(best, rng)
+
+
+POLICIES = {
+    "random" : random_policy,
+    "naiveBot" : first_policy,
+    "lessNaiveBot" : corner_policy,
+}
+
+
+#any in-memory bot (get_move or get_move_bitboard) as a policy, one call per board
+def bot_policy(bot):
+    def policy(me, own, opp, moves, rng):
+        res = np.zeros_like(moves)
+        for i in range(len(moves)):
+            first, second = (int(own[i]), int(opp[i])) if me == reversi.FIRST else (int(opp[i]), int(own[i]))
+            try:
+                if hasattr(bot, "get_move_bitboard"):
+                    x, y = bot.get_move_bitboard(me, first, second)
+                else:
+                    x, y = bot.get_move(me, bitboard.to_board(first, second))
+                res[i] = bitboard.bit(x, y) if 0 <= x < reversi.BOARD_SIZE and 0 <= y < reversi.BOARD_SIZE else 0
+            except Exception:
+                res[i] = 0   #forfeit, like a crash in play_game
+        return res
+    return policy
+
+
+#a built in policy by name, or the bot in a .py file
+def load_policy(name):
+    if name in POLICIES:
+        return POLICIES[name]
+
+    spec = importlib.util.spec_from_file_location(os.path.basename(name)[:-3], name)
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+    return bot_policy(bot)
+
+
+#Play `games` games at once. Returns (winner, discs first, discs second) arrays,
+#winner uses the play_game codes: FIRST, SECOND, TIE, or -1 / -2 for a forfeit
+def play_batch(team, enemy, games, rng):
+    start = bitboard.reversi()
+    first = np.full(games, start.first, dtype=np.uint64)
+    second = np.full(games, start.second, dtype=np.uint64)
+    passes = np.zeros(games, dtype=np.int64)
+    ids = np.arange(games)
+
+    winner = np.zeros(games, dtype=np.int64)
+    discs_first = np.zeros(games, dtype=np.int64)
+    discs_second = np.zeros(games, dtype=np.int64)
+
+    me = reversi.FIRST
+    while len(ids):
+        own, opp, policy = (first, second, team) if me == reversi.FIRST else (second, first, enemy)
+        moves = moves_mask(own, opp)
+        can = moves != 0
+        passes = np.where(can, 0, passes + 1)
+
+        if can.any():
+            move = policy(me, own[can], opp[can], moves[can], rng)
+            #an illegal move loses the game on the spot
+            illegal = (move & moves[can]) == 0
+            if illegal.any():
+                lost = ids[can][illegal]
+                winner[lost] = -1 if me == reversi.FIRST else -2
+                passes[np.flatnonzero(can)[illegal]] = 2
+
+            flips = flips_mask(own[can], opp[can], move)
+            own[can] |= np.where(illegal, 0, move | flips).astype(np.uint64)
+            opp[can] &= ~flips
+
+        #both players passed in a row (or a forfeit): the game is over
+        done = passes >= 2
+        if done.any():
+            over = ids[done]
+            cf, cs = popcount(first[done]), popcount(second[done])
+            discs_first[over], discs_second[over] = cf, cs
+            result = np.where(cf > cs, reversi.FIRST, np.where(cf < cs, reversi.SECOND, reversi.TIE))
+            winner[over] = np.where(winner[over] < 0, winner[over], result)
+
+            keep = ~done
+            first, second, passes, ids = first[keep], second[keep], passes[keep], ids[keep]
+
+        me = reversi.SECOND if me == reversi.FIRST else reversi.FIRST
+    return winner, discs_first, discs_second
+
+
+#Play `games` games in batches, writing one csv row per game to `out` as each batch
+#finishes. Returns {winner code: games}
+def run(team, enemy, games, out=None, batch=BATCH, seed=None) -> dict:
+    rng = np.random.default_rng(seed)
+    random.seed(seed)   #for the random module of in-memory bots, like the sandbox does
+    totals = {}
+
+    f = open(out, "w", newline="") if out else None
+    try:
+        writer = csv.writer(f) if f else None
+        if writer:
+            writer.writerow(["game", "winner", "discs_first", "discs_second"])
+
+        done = 0
+        while done < games:
+            n = min(batch, games - done)
+            winner, cf, cs = play_batch(team, enemy, n, rng)
+            for w, c in zip(*np.unique(winner, return_counts=True)):
+                totals[int(w)] = totals.get(int(w), 0) + int(c)
+            if writer:
+                writer.writerows(zip(range(done, done + n), winner.tolist(), cf.tolist(), cs.tolist()))
+                f.flush()
+            done += n
+    finally:
+        if f:
+            f.close()
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless self-play of trusted bots, many games at a time")
+    parser.add_argument("team", help="first player: %s, or the path of a bot" % ", ".join(POLICIES))
+    parser.add_argument("enemy", help="second player, same as team")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=BATCH, help="games stepped together")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--out", help="csv file for the per game results")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    totals = run(load_policy(args.team), load_policy(args.enemy), args.games, args.out, args.batch, args.seed)
+    took = time.perf_counter() - start
+
+    names = {reversi.FIRST : "first", reversi.SECOND : "second", reversi.TIE : "tie",
+             -1 : "first forfeit", -2 : "second forfeit"}
+    for w, n in sorted(totals.items()):
+        print("%-15s %8d  %5.1f%%" % (names[w], n, 100 * n / args.games))
+    print("%d games in %.1f s, %.0f games/s" % (args.games, took, args.games / took))
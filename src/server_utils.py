@@ -1,12 +1,18 @@
-import os, secrets, sys, multiprocessing
+import os, secrets, sys, multiprocessing, importlib.util, json, logging, py_compile, threading, time
 import src.reversi as reversi
+import src.bitboard as bitboard
+import src.sandbox as sandbox
 
 
 pass_len = 10
 chr_options = "0123456789abcdefghijklmnopqrstuvwxyz" 
 basedir = os.path.join("Submitted Code")
 allowed_pass = []
-TIMEOUT = 0.7
+TIMEOUT = 0.7   #cpu seconds a bot may use per move, see src.sandbox
+ENGINE_VERSION = 1   #bump whenever the referee rules change, old cached results are dropped
+save_hooks = []      #called with the passcode after a bot is overwritten
+game_hooks = []      #called with (team, enemy, seed, result) after every play_game
+bots_info_lock = threading.Lock()
 
 
 #passcode -> path to python file
@@ -27,14 +33,71 @@ def verify_exists(passcode : str) -> bool:
     return os.path.exists(pass_to_pyfile_path(passcode))
 
 
-#upload a new python file 
+#passcode -> its bytecode in __pycache__, where `import` looks for it
+def pass_to_pyc_path(passcode : str) -> str: 
+    return importlib.util.cache_from_source(pass_to_pyfile_path(passcode))
+
+
+#upload a new python file. Raises SyntaxError (and keeps the old bot) if it does not compile
 def save_to_py_file(passcode : str, data : str) -> None: 
     if not os.path.exists(basedir): 
         os.makedirs(basedir)
 
-    with open(pass_to_pyfile_path(passcode), "w") as f: 
+    path = pass_to_pyfile_path(passcode)
+    compile(data, path, "exec")
+    with open(path, "w") as f: 
         f.write(data)
 
+    info = compile_bot(passcode)
+    info.update(measure_import(passcode))
+    save_bot_info(passcode, info)
+
+    for hook in save_hooks: 
+        hook(passcode)
+
+
+#Write the bot's bytecode once, so workers import it without compiling. The pyc is
+#checked against a hash of the source, so a resubmission with the same size and
+#mtime can never load the old code
+def compile_bot(passcode : str) -> dict: 
+    path = pass_to_pyfile_path(passcode)
+    pyc = py_compile.compile(path, cfile=pass_to_pyc_path(passcode), doraise=True, 
+                             invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH)
+    return {"source_bytes" : os.path.getsize(path), "bytecode_bytes" : os.path.getsize(pyc)}
+
+
+#import the bot in a sandbox worker, like a game does, and time it
+def measure_import(passcode : str) -> dict: 
+    if basedir not in sys.path: 
+        sys.path.append(basedir)
+
+    worker = sandbox.bot_worker(passcode, TIMEOUT)
+    try: 
+        worker.start()
+        return {"import_seconds" : worker.import_seconds}
+    except Exception as e: 
+        return {"import_seconds" : None, "import_error" : str(e) or type(e).__name__}
+    finally: 
+        worker.close()
+
+
+#passcode -> {source_bytes, bytecode_bytes, import_seconds, saved_at}, kept in bots.json
+def load_bots_info() -> dict: 
+    path = os.path.join(basedir, "bots.json")
+    if not os.path.exists(path): 
+        return {}
+    with open(path) as f: 
+        return json.load(f)
+
+
+def save_bot_info(passcode : str, info : dict) -> None: 
+    info["saved_at"] = time.time()
+    with bots_info_lock: 
+        bots = load_bots_info()
+        bots[passcode] = info
+        with open(os.path.join(basedir, "bots.json"), "w") as f: 
+            json.dump(bots, f, indent=4)
+
 
 #Generate passcodes for all users  
 def generate_players(count : int) -> None: 
@@ -62,6 +125,7 @@ def generate_players(count : int) -> None:
 
 
 def proc_func(team, me, board, queue): 
+    sandbox.limit_resources()
     team = __import__(team); 
     x, y = team.get_move(me, board); 
     queue.put((x, y)) 
@@ -71,45 +135,96 @@ def child_proc_getmove(team, me, board):
     queue = multiprocessing.Queue()
     my_proc = multiprocessing.Process(target=proc_func, args=(team, me, board, queue))
     
-    my_proc.start()
-    args = queue.get(timeout=TIMEOUT); 
-    my_proc.kill()
+    sandbox.spawn(my_proc)
+    try: 
+        args = queue.get(timeout=TIMEOUT); 
+    finally: 
+        #on a timeout too, and with anything the bot forked
+        sandbox.reap(my_proc)
+        queue.close()
 
     return args[0], args[1] 
     
 
 
-def play_game(team, enemy):     
+#one worker per bot, pass the same dict to several games to keep the workers warm.
+#A bot playing itself gets a second worker, so the two sides never share module globals
+def get_workers(workers, seed, *teams): 
+    keys = [t if t not in teams[:i] else (t, i) for i, t in enumerate(teams)]
+    for t, key in zip(teams, keys): 
+        if key not in workers: 
+            workers[key] = sandbox.bot_worker(t, TIMEOUT, seed)
+    return [workers[key] for key in keys]
+
+
+def close_workers(workers): 
+    for w in workers.values(): 
+        w.close()
+    workers.clear()
+
+
+#(first, second) bitboards of either engine, for the workers
+def position(game): 
+    if isinstance(game, bitboard.reversi): 
+        return game.first, game.second
+    return bitboard.to_bitboards(game.board)
+
+
+#with a seed, bots that use `random` replay the same game every time.
+#on_move([x, y]) is called as soon as a move is played, for live viewers.
+#8x8 games run on the bitboard engine, other (even) sizes on src.reversi
+def play_game(team, enemy, workers=None, seed=None, on_move=None, size=reversi.BOARD_SIZE):     
     if basedir not in sys.path: 
         sys.path.append(basedir)
 
-    game = reversi.reversi()
+    own_workers = workers is None
+    if own_workers: 
+        workers = {}
+    game = bitboard.reversi() if size == reversi.BOARD_SIZE else reversi.reversi(size)
+    team_worker, enemy_worker = get_workers(workers, seed, team, enemy)
+
     logs = []
+    timings = []
     win_rep = None
 
-    while game.winner() == reversi.UNKNOWN: 
-        
-        if any(game.can_move(i, j, reversi.FIRST) for i in range(reversi.BOARD_SIZE) for j in range(reversi.BOARD_SIZE)): 
-            try: 
-                x, y = child_proc_getmove(team, reversi.FIRST, game.get_board()); 
-                game.play(x, y, reversi.FIRST)
-                logs.append([x, y]) 
-            except: 
-                game.set_winner = reversi.SECOND
-                win_rep = -1
-
-        if game.set_winner == reversi.UNKNOWN and any(game.can_move(i, j, reversi.SECOND) for i in range(reversi.BOARD_SIZE) for j in range(reversi.BOARD_SIZE)): 
-            try: 
-                x, y = child_proc_getmove(enemy, reversi.SECOND, game.get_board()); 
-                game.play(x, y, reversi.SECOND) 
-                logs.append([x, y])
-            except: 
-                game.set_winner = reversi.FIRST
-                win_rep = -2
+    try: 
+        while game.winner() == reversi.UNKNOWN: 
+            
+            if game.get_moves(reversi.FIRST): 
+                try: 
+                    x, y = team_worker.get_move(reversi.FIRST, *position(game), size); 
+                    game.play(x, y, reversi.FIRST)
+                    logs.append([x, y]) 
+                    if on_move: 
+                        on_move([x, y])
+                except: 
+                    game.set_winner = reversi.SECOND
+                    win_rep = -1
+                timings.append(dict(team_worker.stats, player=reversi.FIRST))
+
+            if game.set_winner == reversi.UNKNOWN and game.get_moves(reversi.SECOND): 
+                try: 
+                    x, y = enemy_worker.get_move(reversi.SECOND, *position(game), size); 
+                    game.play(x, y, reversi.SECOND) 
+                    logs.append([x, y])
+                    if on_move: 
+                        on_move([x, y])
+                except: 
+                    game.set_winner = reversi.FIRST
+                    win_rep = -2
+                timings.append(dict(enemy_worker.stats, player=reversi.SECOND))
+    finally: 
+        if own_workers: 
+            close_workers(workers)
 
     if win_rep is None: 
         win_rep = game.winner()
-    return {"moves" : logs, "winner" : win_rep}
-
-    
-    
\ No newline at end of file
+    discs = [game.count(reversi.FIRST), game.count(reversi.SECOND)]
+    res = {"moves" : logs, "winner" : win_rep, "discs" : discs, "timings" : timings, "size" : size}
+    #a failing hook (the archive, the ladder) must never change the game's result
+    for hook in game_hooks: 
+        try: 
+            hook(team, enemy, seed, res)
+        except Exception: 
+            logging.exception("game hook %s failed for %s vs %s", getattr(hook, "__name__", hook), team, enemy)
+    return res
@@ -0,0 +1,122 @@
+import os, sys, itertools, collections, time
+import src.reversi as reversi
+import src.server_utils as server_utils
+import src.game_pool as game_pool
+
+
+#every bot that has a file in Submitted Code
+def list_bots() -> list:
+    if not os.path.exists(server_utils.basedir):
+        return []
+
+    bots = [f[:-3] for f in os.listdir(server_utils.basedir) if f.endswith(".py")]
+    return sorted(b for b in bots if server_utils.verify_exists(b))
+
+
+#all ordered pairs, so every pairing is played with both colors
+def schedule(bots) -> list:
+    return list(itertools.permutations(bots, 2))
+
+
+def new_row(bot) -> dict:
+    return {"bot" : bot, "games" : 0, "wins" : 0, "losses" : 0, "ties" : 0, "crashes" : 0, "discs" : 0}
+
+
+#fold one play_game result into the standings
+def add_result(standings, team, enemy, res) -> None:
+    first, second = standings[team], standings[enemy]
+    first["games"] += 1
+    second["games"] += 1
+
+    cf, cs = res.get("discs", [0, 0])
+    first["discs"] += cf - cs
+    second["discs"] += cs - cf
+
+    winner = res["winner"]
+    if winner == -1:
+        first["crashes"] += 1
+        winner = reversi.SECOND
+    elif winner == -2:
+        second["crashes"] += 1
+        winner = reversi.FIRST
+
+    if winner == reversi.FIRST:
+        first["wins"] += 1
+        second["losses"] += 1
+    elif winner == reversi.SECOND:
+        second["wins"] += 1
+        first["losses"] += 1
+    else:
+        first["ties"] += 1
+        second["ties"] += 1
+
+
+def sort_standings(standings) -> list:
+    return sorted(standings.values(), key=lambda r: (r["wins"], r["discs"]), reverse=True)
+
+
+#Yields (team, enemy, result) of every game as they finish. A shared pool is not
+#flooded: at most one game per pool process is queued at a time, and a full queue is
+#waited out like any other client of the pool would
+def play_games(pool, games, size):
+    queued = collections.deque()
+    for team, enemy in games:
+        while True:
+            job_id = pool.submit(team, enemy, size=size) if len(queued) < pool.size else None
+            if job_id is not None:
+                break
+            if queued:
+                t, e, done = queued.popleft()
+                yield t, e, pool.wait(done)
+            else:
+                time.sleep(pool.retry_after())
+        queued.append((team, enemy, job_id))
+
+    while queued:
+        t, e, done = queued.popleft()
+        yield t, e, pool.wait(done)
+
+
+#play every pairing on a pool of game processes: the server passes its own, otherwise
+#one is started with a process per core by default. Smaller boards make quick smoke runs
+def run_tournament(bots=None, processes=None, size=reversi.BOARD_SIZE, pool=None) -> list:
+    if bots is None:
+        bots = list_bots()
+    if server_utils.basedir not in sys.path:
+        sys.path.append(server_utils.basedir)
+
+    games = schedule(bots)
+    standings = {b : new_row(b) for b in bots}
+    if not games:
+        return sort_standings(standings)
+
+    own_pool = pool is None
+    if own_pool:
+        pool = game_pool.game_pool(size=processes or os.cpu_count() or 1, max_queue=len(games))
+    try:
+        for team, enemy, res in play_games(pool, games, size):
+            if "error" in res:
+                continue
+            add_result(standings, team, enemy, res)
+    finally:
+        if own_pool:
+            pool.close()
+
+    return sort_standings(standings)
+
+
+def format_standings(rows) -> str:
+    lines = ["%-4s %-20s %6s %5s %7s %5s %8s %6s" % ("#", "bot", "games", "wins", "losses", "ties", "crashes", "discs")]
+    for i, r in enumerate(rows):
+        lines.append("%-4d %-20s %6d %5d %7d %5d %8d %+6d" % (i + 1, r["bot"], r["games"], r["wins"], r["losses"], r["ties"], r["crashes"], r["discs"]))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import src.archive as archive
+    import src.ladder as ladder
+    server_utils.game_hooks.append(archive.record_game)
+    server_utils.game_hooks.append(ladder.record_game)
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else reversi.BOARD_SIZE
+    print(format_standings(run_tournament(processes=processes, size=size)))
@@ -8,16 +8,17 @@ def distance_to_corner(x, y, game_size):
 
 def get_move(me, board):
     #get a reversi object.
-    game = reversi.reversi()
+    size = len(board)
+    game = reversi.reversi(size)
     game.current_player = me
     game.board = board
 
-    min_distance = reversi.BOARD_SIZE
+    min_distance = size
     min_locations = []
-    for i in range(reversi.BOARD_SIZE):
-        for j in range(reversi.BOARD_SIZE):
+    for i in range(size):
+        for j in range(size):
             if game.can_move(i, j, me):
-                dis = distance_to_corner(i, j, reversi.BOARD_SIZE)
+                dis = distance_to_corner(i, j, size)
                 if dis < min_distance:
                     min_distance = dis
                     min_locations = [(i, j)]
@@ -3,11 +3,12 @@ import src.reversi as reversi
 
 def get_move(me, board): 
     #get a reversi object. 
-    game = reversi.reversi()
+    size = len(board)
+    game = reversi.reversi(size)
     game.current_player = me
     game.board = board 
 
-    for i in range(reversi.BOARD_SIZE): 
-        for j in range(reversi.BOARD_SIZE): 
+    for i in range(size): 
+        for j in range(size): 
             if game.can_move(i, j, me): 
                 return i, j 
@@ -1,11 +1,11 @@
 # Example reversi bot.
 
 # A function to return your next move.
-# 'board' is a 8x8 int array, with 0 being an empty cell and 1,2 being you and the opponent,
-# determained by the input 'me'.
+# 'board' is a 8x8 int array (or another even size, when the game is run with one), with 0
+# being an empty cell and 1,2 being you and the opponent, determained by the input 'me'.
 def get_move(me : int, board : list[list[int]]) -> tuple[int]:
-    for i in range(8): 
-        for j in range(8): 
+    for i in range(len(board)): 
+        for j in range(len(board)): 
             if valid_move(i, j, me, board):
                 return i, j 
     
@@ -1,6 +1,27 @@
 #While these are written as constants,
 # there's no guarantee that the program will continue to work if any of them is changed
+import mmap
+import multiprocessing
+import os
 import random
+import time
+
+try:
+    import numpy as np
+except ImportError:  # The pure Python evaluators are used instead
+    np = None
+
+try:
+    # Running on the game server: use its per-move limit
+    from src.server_utils import TIMEOUT
+except ImportError:
+    TIMEOUT = 0.7
+
+try:
+    # The shared opening book, only available next to the game server
+    import src.book as book
+except ImportError:
+    book = None
 
 
 BS = 8  # Board size
@@ -10,6 +31,11 @@ BLACK = 1
 WHITE = 2
 HASH_KEY = 18446744073709551557
 
+# Zobrist keys: one random 64-bit number per (square, color), EMPTY is 0 so it never changes the key
+_zobristRandom = random.Random(HASH_KEY)
+ZOBRIST = [[[0, _zobristRandom.getrandbits(64), _zobristRandom.getrandbits(64)] for _ in range(BS)] for _ in range(BS)]
+ZOBRIST_SIDE = _zobristRandom.getrandbits(64)
+
 
 class Reversi:
     """
@@ -20,6 +46,7 @@ class Reversi:
         self.board = None
         self.current = None
         self.history = None
+        self.hash = 0
         self.reset()
 
     def reset(self):
@@ -33,6 +60,33 @@ class Reversi:
         self.board[3][4] = self.board[4][3] = WHITE
         self.current = BLACK
         self.history = []  # Save history for undo operations
+        self.rehash()
+
+    def load(self, board, current):
+        """
+        Start from a given position, e.g. the board passed to get_move
+        """
+        self.board = board
+        self.current = current
+        self.history = []
+        self.rehash()
+
+    def rehash(self):
+        """
+        Compute the Zobrist key from scratch, put/undo keep it up to date after that
+        """
+        self.hash = ZOBRIST_SIDE if self.current == WHITE else 0
+        for x in range(BS):
+            for y in range(BS):
+                self.hash ^= ZOBRIST[x][y][self.board[x][y]]
+
+    def setSquare(self, x, y, chess):
+        """
+        Change one square and its share of the Zobrist key
+        """
+        square = ZOBRIST[x][y]
+        self.hash ^= square[self.board[x][y]] ^ square[chess]
+        self.board[x][y] = chess
 
     def toggle(self):
         """
@@ -40,6 +94,7 @@ class Reversi:
         """
         # A trick used commonly in code golfs
         self.current = [BLACK, WHITE][self.current == BLACK]
+        self.hash ^= ZOBRIST_SIDE
 
     def check(self, x, y, dx, dy, player=None, operate=False, func=lambda *a: None):
         """
@@ -76,7 +131,7 @@ class Reversi:
                 while c > 0:
                     x -= dx
                     y -= dy
-                    self.board[x][y] = player
+                    self.setSquare(x, y, player)
                     func(x, y)
                     c -= 1
             return True
@@ -182,7 +237,7 @@ class Reversi:
         if len(changes) == 0:  # Not movable
             return False
 
-        self.board[x][y] = player
+        self.setSquare(x, y, player)
         changes.append((x, y))
         self.history.append(changes)
         self.toggle()
@@ -207,17 +262,18 @@ class Reversi:
         if len(self.history) == 0:
             return False, 0
 
-        lastPlayer = [WHITE, BLACK][len(self.history) % 2]
-        lastFlip = [BLACK, WHITE][lastPlayer == BLACK]
         lastOp = self.history.pop()
         if len(lastOp) == 0:
             self.toggle()
             return True, self.undo()[1]
 
-        for x, y in lastOp:
-            self.board[x][y] = lastFlip
+        # The placed piece tells who moved, history may not start at the opening
+        x, y = lastOp[-1]
+        lastFlip = [BLACK, WHITE][self.board[x][y] == BLACK]
+        for x, y in lastOp[:-1]:
+            self.setSquare(x, y, lastFlip)
         x, y = lastOp[-1]
-        self.board[x][y] = EMPTY
+        self.setSquare(x, y, EMPTY)
         self.toggle()
         return True, len(lastOp)
 
@@ -229,6 +285,7 @@ class Reversi:
         game.board = [list(col) for col in self.board]
         game.history = [list(h) for h in self.history]
         game.current = self.current
+        game.hash = self.hash
         return game
 
     def __str__(self):
@@ -236,11 +293,7 @@ class Reversi:
         return "\n".join(" ".join([".", "O", "X"][self.board[x][y]] for x in range(BS)) for y in range(BS))
 
     def __hash__(self):
-        res = 0
-        for x in range(8):
-            for y in range(8):
-                res = (3 * res + self.board[x][y]) % HASH_KEY
-        return res ^ (1 + self.current)
+        return self.hash
 
 
 # File: ai.py
@@ -250,6 +303,9 @@ class Reversi:
 inf = 999999  # Don't use math.inf
 MIN_NODES = 10000
 MIN_TICK = 1000
+# Share of TIMEOUT the search may use, the rest covers process and pipe overhead
+TIME_BUDGET = 0.6
+MAX_DEPTH = 20
 
 # flake8 ............
 SCORE = [
@@ -281,6 +337,379 @@ AICONFIG = [
 
 DIRECTIONS = [(x - 1, y - 1) for i in range(3) for y, x in enumerate([i] * 3)]
 
+TT_BITS = 18  # 2 ** 18 entries
+# Processes of the parallel search, the bot's own included. Off (1) unless DALIT_PROCESSES
+# asks for more: bench.py has not shown a speedup yet. The sandbox charges a move with
+# the cpu of every process the bot runs, so each move's search time is split between
+# them (see get_move). Never more than there are cores
+SEARCH_PROCESSES = min(int(os.environ.get("DALIT_PROCESSES", "1")), os.cpu_count() or 1)
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search once the deadline has passed
+    """
+
+EXACT, LOWER, UPPER = 0, 1, 2  # What a stored score means
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results indexed by the Zobrist key
+    Each slot keeps (key, depth, bound, score, bestStep, generation)
+    Static evaluations live in a separate always-replace array of (key, score)
+    """
+
+    def __init__(self, bits=TT_BITS):
+        self.mask = (1 << bits) - 1
+        self.slots = [None] * (1 << bits)
+        self.evals = [None] * (1 << bits)
+        self.generation = 0
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+        self.evals = [None] * len(self.evals)
+        self.generation = 0
+
+    def getEval(self, key):
+        slot = self.evals[key & self.mask]
+        if slot is not None and slot[0] == key:
+            return slot[1]
+        return None
+
+    def putEval(self, key, score):
+        self.evals[key & self.mask] = (key, score)
+
+    def newSearch(self):
+        """
+        Entries from older searches are replaced first
+        """
+        self.generation += 1
+
+    def get(self, key):
+        slot = self.slots[key & self.mask]
+        if slot is not None and slot[0] == key:
+            return slot
+        return None
+
+    def put(self, key, depth, bound, score, bestStep=()):
+        """
+        Replacement policy: keep the deeper result of the current search,
+        anything stored by an older search can be overwritten
+        """
+        index = key & self.mask
+        slot = self.slots[index]
+        if slot is not None and slot[5] == self.generation and slot[1] > depth:
+            return
+        if slot is not None and slot[0] == key and not bestStep:
+            bestStep = slot[4]  # Keep the old move for ordering
+        self.slots[index] = (key, depth, bound, score, bestStep, self.generation)
+
+
+SCORE_BIAS = 1 << 31  # Scores are stored unsigned
+
+
+class SharedTable(TranspositionTable):
+    """
+    TranspositionTable in memory shared with the helper processes of ParallelSearch
+    A slot is two 64-bit words (key ^ data, data), so a slot torn by two processes
+    writing at once fails the key check and reads as empty: no locks are needed
+    """
+
+    def __init__(self, bits=TT_BITS):
+        size = 1 << bits
+        self.mask = size - 1
+        self.evalBase = 2 * size
+        self.stopIndex = 4 * size
+        # Anonymous shared mapping, still shared by the processes forked after it
+        self.memory = mmap.mmap(-1, 8 * (4 * size + 1))
+        self.words = memoryview(self.memory).cast("Q")
+        self.generation = 0
+
+    def clear(self):
+        self.memory[:] = bytes(len(self.memory))
+        self.generation = 0
+
+    def getEval(self, key):
+        index = self.evalBase + 2 * (key & self.mask)
+        data = self.words[index + 1]
+        if data and self.words[index] ^ data == key:
+            return data - SCORE_BIAS
+        return None
+
+    def putEval(self, key, score):
+        index = self.evalBase + 2 * (key & self.mask)
+        data = int(score) + SCORE_BIAS
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+
+    def get(self, key):
+        index = 2 * (key & self.mask)
+        data = self.words[index + 1]
+        if not data or self.words[index] ^ data != key:
+            return None
+        step = (data >> 42) & 0x7F
+        bestStep = divmod(step - 1, BS) if step else ()
+        return (key, (data >> 32) & 0xFF, (data >> 40) & 0x3, (data & 0xFFFFFFFF) - SCORE_BIAS,
+                bestStep, data >> 49)
+
+    def put(self, key, depth, bound, score, bestStep=()):
+        index = 2 * (key & self.mask)
+        generation = self.generation & 0x7FFF
+        # The key stored in the slot, whichever position it is
+        slot = self.get(self.words[index] ^ self.words[index + 1]) if self.words[index + 1] else None
+        if slot is not None and slot[5] == generation and slot[1] > depth:
+            return
+        if slot is not None and slot[0] == key and not bestStep:
+            bestStep = slot[4]  # Keep the old move for ordering
+        step = bestStep[0] * BS + bestStep[1] + 1 if bestStep else 0
+        data = (int(score) + SCORE_BIAS) | depth << 32 | bound << 40 | step << 42 | generation << 49
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+
+    def stop(self):
+        """
+        Tell the helpers that the search of this generation is over
+        """
+        self.words[self.stopIndex] = self.generation
+
+    def stopped(self, generation):
+        return self.words[self.stopIndex] == generation
+
+
+EDGE = 3  # Padding value outside the board for the NumPy evaluators
+# The 4 lines through a square, each as its two opposite directions (as in stability)
+AXES = [((0, -1), (0, 1)), ((-1, 0), (1, 0)), ((-1, -1), (1, 1)), ((1, -1), (-1, 1))]
+
+if np is not None:
+    SCORE_NP = np.array(SCORE)
+    STABILITY_NP = np.array(STABILITY)
+    # Index into a flattened board padded by BS on every side of the square
+    # t steps away from (x, y), laid out as [direction][t - 1][x][y] following AXES
+    RAY_INDEX = np.array([[[[(BS + x + t * dx) * 3 * BS + BS + y + t * dy for y in range(BS)]
+                            for x in range(BS)]
+                           for t in range(1, BS + 1)]
+                          for axis in AXES for dx, dy in axis])
+
+
+def npLiberties(boards):
+    """
+    Number of empty neighbours of every square, for an (n, BS, BS) array of boards
+    """
+    empty = np.zeros((len(boards), BS + 2, BS + 2), dtype=int)
+    empty[:, 1:-1, 1:-1] = boards == EMPTY
+    liberties = np.zeros(boards.shape, dtype=int)
+    for dx, dy in DIRECTIONS:
+        liberties += empty[:, 1 + dx:BS + 1 + dx, 1 + dy:BS + 1 + dy]
+    return liberties
+
+
+def npStability(boards):
+    """
+    ReversiAI.stability of every square, for an (n, BS, BS) array of boards.
+    For each direction, find what ends the run of same colored pieces starting at a
+    square (EDGE if the run reaches the border), then count the lines where one end
+    is the border or both ends are the opponent
+    """
+    n = len(boards)
+    padded = np.full((n, 3 * BS, 3 * BS), EDGE)
+    padded[:, BS:2 * BS, BS:2 * BS] = boards
+
+    cells = padded.reshape(n, -1)[:, RAY_INDEX]  # (n, direction, step, x, y)
+    first = (cells != boards[:, None, None]).argmax(axis=2)
+    ends = np.take_along_axis(cells, first[:, :, None], axis=2)[:, :, 0]
+
+    other = (3 - boards)[:, None]  # BLACK <-> WHITE
+    e1, e2 = ends[:, 0::2], ends[:, 1::2]
+    degree = ((e1 == EDGE) | (e2 == EDGE) | ((e1 == other) & (e2 == other))).sum(axis=1)
+    degree[boards == EMPTY] = 0
+    return degree
+
+
+# Bitboards for the endgame solver: square (x, y) is bit x * BS + y
+FULL = (1 << BS * BS) - 1
+_firstColumn = sum(1 << (x * BS) for x in range(BS))
+INNER = FULL & ~_firstColumn & ~(_firstColumn << (BS - 1))  # Opponent pieces that can't wrap around a row
+BIT_DIRECTIONS = [(1, INNER), (BS, FULL), (BS - 1, INNER), (BS + 1, INNER)]
+_half = BS // 2
+QUADRANTS = [sum(1 << (x * BS + y) for x in range(qx, qx + _half) for y in range(qy, qy + _half))
+             for qx in (0, _half) for qy in (0, _half)]
+SORT_EMPTIES = 6  # Above this many empties the solver sorts moves fastest-first and uses its table
+SOLVER_TABLE_SIZE = 1 << 16
+SOLVER_EMPTIES = 14  # Most empties the solver is tried on, more rarely finishes in time
+
+
+def bitMoves(own, opp):
+    """
+    Mask of every square `own` can move to
+    """
+    empty = FULL & ~(own | opp)
+    moves = 0
+    for s, mask in BIT_DIRECTIONS:
+        # Runs of up to 6 opponent pieces: 1 + 1 and then two steps of 2 using pairs
+        o = opp & mask
+        s2 = s + s
+        t = o & (own << s)
+        t |= o & (t << s)
+        pairs = o & (o << s)
+        t |= pairs & (t << s2)
+        t |= pairs & (t << s2)
+        moves |= empty & (t << s)
+        t = o & (own >> s)
+        t |= o & (t >> s)
+        pairs = o & (o >> s)
+        t |= pairs & (t >> s2)
+        t |= pairs & (t >> s2)
+        moves |= empty & (t >> s)
+    return moves
+
+
+def bitFlips(own, opp, move):
+    """
+    Mask of the pieces flipped when `own` moves to the square `move`
+    """
+    flips = 0
+    for s, mask in BIT_DIRECTIONS:
+        o = opp & mask
+        line = 0
+        t = o & (move << s)
+        while t:
+            line |= t
+            t = o & (t << s)
+        if line and own & (line << s) & ~(line | o):
+            flips |= line
+        line = 0
+        t = o & (move >> s)
+        while t:
+            line |= t
+            t = o & (t >> s)
+        if line and own & (line >> s) & ~(line | o):
+            flips |= line
+    return flips
+
+
+class EndgameSolver:
+    """
+    Exact negamax search on bitboards for the last empties.
+    Scores are final disc differences for the side to move.
+    Moves are sorted fastest-first (fewest replies for the opponent) while
+    many squares are empty, and by region parity (odd quadrants first) near the end.
+    Nodes with many empties keep (lower bound, upper bound, best move) in a table
+    """
+
+    def __init__(self, ai):
+        self.ai = ai  # Owns the deadline and the node counter
+        self.table = {}
+
+    def solve(self, own, opp, alpha, beta, passed=False):
+        ai = self.ai
+        ai.nodeCount += 1
+        if not ai.nodeCount & 255:
+            ai.checkTime()
+
+        empty = FULL & ~(own | opp)
+        if not empty & (empty - 1):
+            return self.solveLast(own, opp, empty)
+
+        moves = bitMoves(own, opp)
+        if not moves:
+            if passed or not empty:
+                return own.bit_count() - opp.bit_count()
+            return -self.solve(opp, own, -beta, -alpha, True)
+
+        empties = empty.bit_count()
+        useTable = empties > SORT_EMPTIES
+        ttMove = 0
+        if useTable:
+            entry = self.table.get((own, opp))
+            if entry is not None:
+                lower, upper, ttMove = entry
+                if lower >= beta:
+                    return lower
+                if upper <= alpha:
+                    return upper
+                alpha, beta = max(alpha, lower), min(beta, upper)
+        alphaOrig = alpha
+
+        best, bestMove = -BS * BS - 1, 0
+        for move, flips in self.order(own, opp, moves, empty, empties, ttMove):
+            score = -self.solve(opp & ~flips, own | move | flips, -beta, -alpha)
+            if score > best:
+                best, bestMove = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if useTable:
+            if len(self.table) >= SOLVER_TABLE_SIZE:
+                self.table.clear()
+            lower = best if best > alphaOrig else -BS * BS
+            upper = best if best < beta else BS * BS
+            self.table[own, opp] = (lower, upper, bestMove)
+        return best
+
+    def solveLast(self, own, opp, empty):
+        """
+        One (or no) empty square left: no move generation needed
+        """
+        if empty:
+            flips = bitFlips(own, opp, empty)
+            if flips:
+                return (own | flips).bit_count() + 1 - (opp & ~flips).bit_count()
+            flips = bitFlips(opp, own, empty)
+            if flips:
+                return (own & ~flips).bit_count() - (opp | flips).bit_count() - 1
+        return own.bit_count() - opp.bit_count()
+
+    def order(self, own, opp, moves, empty, empties, first=0):
+        """
+        List of (move, flips) in search order, `first` (a move from the table) leads
+        """
+        odd = 0
+        for quadrant in QUADRANTS:
+            if (empty & quadrant).bit_count() & 1:
+                odd |= quadrant
+
+        result = []
+        while moves:
+            move = moves & -moves
+            moves ^= move
+            result.append((move, bitFlips(own, opp, move)))
+
+        if empties > SORT_EMPTIES:
+            result.sort(key=lambda m: (m[0] != first, bitMoves(opp & ~m[1], own | m[0] | m[1]).bit_count(),
+                                       not m[0] & odd))
+        else:
+            result.sort(key=lambda m: not m[0] & odd)
+        return result
+
+    def solveRoot(self, game, player, alpha=-1, beta=1):
+        """
+        Best move for `player` and its score. The default window only decides
+        win / draw / loss, which is much faster than the exact margin
+        """
+        board = game.board
+        own = opp = 0
+        for x in range(BS):
+            for y in range(BS):
+                if board[x][y] == player:
+                    own |= 1 << (x * BS + y)
+                elif board[x][y] != EMPTY:
+                    opp |= 1 << (x * BS + y)
+
+        self.table.clear()
+        empty = FULL & ~(own | opp)
+        bestScore, bestStep = -BS * BS - 1, ()
+        for move, flips in self.order(own, opp, bitMoves(own, opp), empty, empty.bit_count()):
+            score = -self.solve(opp & ~flips, own | move | flips, -beta, -alpha)
+            if score > bestScore:
+                bestScore, bestStep = score, divmod(move.bit_length() - 1, BS)
+                alpha = max(alpha, score)
+                if alpha >= beta:
+                    break
+        return bestScore, bestStep
+
 
 class ReversiAI:
     def __init__(self):
@@ -289,7 +718,11 @@ class ReversiAI:
         self.maxDepth = None
         self.final = 16
         self.aiLevel = 8
-        self.saveState = dict()
+        self.deadline = None
+        self.table = TranspositionTable()
+        self.solver = EndgameSolver(self)
+        self.parallel = None
+        self.stopGeneration = None  # Set in helpers: stop once the main search is over
         self.setLevel()
 
     # Heuristic Reversi game evaluation methods, chosen at different difficulties
@@ -348,15 +781,17 @@ class ReversiAI:
                     c2 += 1
                     s2 += SCORE[x][y] - liberty * LIBERTY
 
-        if c1 == 0:
-            return -inf
-        if c2 == 0:
-            return inf
-        if c1 + c2 == BS ** 2:
-            if c1 > c2:
-                return inf
-            if c2 > c1:
-                return -inf
+        score = self.terminalScore(c1, c2)
+        if score is not None:
+            return score
+
+        return s1 - s2 + self.cornerScore(board)
+
+    def cornerScore(self, board):
+        """
+        Corner adjustments of heuristicEval_4, as a black minus white difference
+        """
+        s1, s2 = 0, 0
 
         def checkCorner(pos, adjacents, dpos):
             nonlocal s1, s2
@@ -401,6 +836,55 @@ class ReversiAI:
 
         return s1 - s2
 
+    def terminalScore(self, c1, c2):
+        """
+        heuristicEval_4's result when a side is wiped out or the board is full, else None
+        """
+        if c1 == 0:
+            return -inf
+        if c2 == 0:
+            return inf
+        if c1 + c2 == BS ** 2:
+            if c1 > c2:
+                return inf
+            if c2 > c1:
+                return -inf
+        return None
+
+    # NumPy versions of heuristicEval_3 and heuristicEval_4, they give the same scores
+    # but work on whole boards (or a batch of boards) at once
+
+    def heuristicEval_3_np(self, game, player):
+        board = np.array(game.board)
+        values = STABILITY_NP[npStability(board[None])[0]]
+        s1 = int(values[board == BLACK].sum()) + len(game.getAvailables(BLACK))
+        s2 = int(values[board == WHITE].sum()) + len(game.getAvailables(WHITE))
+        return s1 - s2
+
+    def heuristicEval_4_np(self, game, player):
+        return self.batchEval_4([game.board])[0]
+
+    def batchEval_4(self, boards):
+        """
+        heuristicEval_4 of a list of boards, evaluated together
+        """
+        self.nodeCount += len(boards)
+        array = np.array(boards)
+        values = SCORE_NP - npLiberties(array) * LIBERTY
+        black = array == BLACK
+        white = array == WHITE
+        c1s = black.sum(axis=(1, 2)).tolist()
+        c2s = white.sum(axis=(1, 2)).tolist()
+        diffs = ((values * black).sum(axis=(1, 2)) - (values * white).sum(axis=(1, 2))).tolist()
+
+        scores = []
+        for board, c1, c2, diff in zip(boards, c1s, c2s, diffs):
+            score = self.terminalScore(c1, c2)
+            if score is None:
+                score = diff + self.cornerScore(board)
+            scores.append(score)
+        return scores
+
     def stability(self, game, pos):
         board = game.board
         x, y = pos
@@ -438,24 +922,74 @@ class ReversiAI:
             score = -inf
         return score
 
+    def leafScore(self, game, player):
+        """
+        Static evaluation, cached by the Zobrist key
+        """
+        score = self.table.getEval(game.hash)
+        if score is None:
+            score = self.heuristicScore(game, player)
+            self.table.putEval(game.hash, score)
+        return score
+
     def getHeuristicScore(self, game, player, step):
         game.put(step)
-        try:
-            score = self.saveState[game]
-        except KeyError:
-            score = self.heuristicScore(game, player)
-            self.saveState[game] = score
+        score = self.leafScore(game, player)
         game.undo()
         return score
 
+    def getHeuristicScores(self, game, player, steps):
+        """
+        getHeuristicScore for every step, the uncached ones are evaluated as one batch
+        """
+        if self.batchScore is None:
+            return {step: self.getHeuristicScore(game, player, step) for step in steps}
+
+        hValue = {}
+        missing, boards, keys = [], [], []
+        for step in steps:
+            game.put(step)
+            score = self.table.getEval(game.hash)
+            if score is None:
+                missing.append(step)
+                boards.append([list(col) for col in game.board])
+                keys.append(game.hash)
+            else:
+                hValue[step] = score
+            game.undo()
+
+        if missing:
+            for step, key, score in zip(missing, keys, self.batchScore(boards)):
+                self.table.putEval(key, score)
+                hValue[step] = score
+        return hValue
+
+    def checkTime(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.stopGeneration is not None and self.table.stopped(self.stopGeneration):
+            raise SearchTimeout()
+
     def heuristicSearch(self, game, player, depth, alpha, beta):
+        self.checkTime()
         if depth <= 0:
-            try:
-                return self.saveState[game]
-            except KeyError:
-                score = self.heuristicScore(game, player)
-                self.saveState[game] = score
-                return score
+            return self.leafScore(game, player), ()
+
+        key = game.hash
+        alphaOrig, betaOrig = alpha, beta
+        ttStep = ()
+        entry = self.table.get(key)
+        if entry is not None:
+            _, ttDepth, bound, ttScore, ttStep, _ = entry
+            if ttDepth >= depth and ttStep:
+                if bound == EXACT:
+                    return ttScore, ttStep
+                if bound == LOWER:
+                    alpha = max(alpha, ttScore)
+                else:
+                    beta = min(beta, ttScore)
+                if alpha >= beta:
+                    return ttScore, ttStep
 
         maxMode = (game.current == BLACK)
         score = -inf - 1 if maxMode else inf + 1
@@ -463,10 +997,12 @@ class ReversiAI:
         bestStep = ()
 
         if len(steps) > 0:
-            hValue = {}
-            for step in steps:
-                hValue[step] = self.getHeuristicScore(game, player, step)
+            hValue = self.getHeuristicScores(game, player, steps)
             steps = sorted(steps, key=lambda s: hValue[s], reverse=maxMode)
+            if ttStep in hValue:
+                # The best move of an earlier search goes first
+                steps.remove(ttStep)
+                steps.insert(0, ttStep)
 
             if depth == 1:
                 step = steps[0]
@@ -498,43 +1034,14 @@ class ReversiAI:
                 return rscore, ()
             else:
                 return self.exactScore(game, player), ()
-        return score, bestStep
-
-    def exactSearch(self, game, player, depth, alpha, beta):
-        if depth <= 0:
-            return self.exactScore(game, player), ()
-
-        maxMode = (game.current == BLACK)
-        score = -inf - 1 if maxMode else inf + 1
-        steps = game.getAvailables()
-        bestStep = ()
-
-        if len(steps) > 0:
-            for step in steps:
-                game.put(step)
-                rscore, rstep = self.exactSearch(game, player, depth - 1, alpha, beta)
-                game.undo()
 
-                if maxMode:
-                    if rscore > score:
-                        score, bestStep = rscore, step
-                    alpha = max(alpha, score)
-                    if alpha >= beta:
-                        break
-                else:
-                    if rscore < score:
-                        score, bestStep = rscore, step
-                    beta = min(beta, score)
-                    if alpha >= beta:
-                        break
+        if score <= alphaOrig:
+            bound = UPPER
+        elif score >= betaOrig:
+            bound = LOWER
         else:
-            if not game.over:
-                game.skipPut()
-                rscore, rstep = self.exactSearch(game, player, depth, alpha, beta)
-                game.undo()
-                return rscore, ()
-            else:
-                return self.exactScore(game, player), ()
+            bound = EXACT
+        self.table.put(key, depth, bound, score, bestStep)
         return score, bestStep
 
     def setLevel(self, level=None):
@@ -544,11 +1051,51 @@ class ReversiAI:
         self.aiLevel = level
         self.depth, self.final, evalLevel = AICONFIG[level]
         self.heuristicScore = getattr(self, "heuristicEval_" + str(evalLevel))
+        # Scores all the children of a node in one go, for move ordering
+        self.batchScore = None
+        if np is not None and hasattr(self, "heuristicEval_%d_np" % evalLevel):
+            self.heuristicScore = getattr(self, "heuristicEval_%d_np" % evalLevel)
+            self.batchScore = getattr(self, "batchEval_%d" % evalLevel, None)
 
         # Clear saved states
-        self.saveState.clear()
+        self.table.clear()
 
-    def findBestStep(self, game):
+    def timedSearch(self, search, game, *args):
+        """
+        Run a search, returns None if it hits the deadline
+        The game is rolled back to where the search started
+        """
+        historyLength = len(game.history)
+        try:
+            return search(game, *args)
+        except SearchTimeout:
+            while len(game.history) > historyLength:
+                game.undo()
+            return None
+
+    def iterativeSearch(self, game, player):
+        """
+        Heuristic search one ply deeper at a time until the deadline or self.depth.
+        Each iteration leaves its best moves in the transposition table, which
+        orders the next one. Returns the move of the deepest completed iteration.
+        """
+        bestStep = ()
+        for depth in range(1, self.depth + 1):
+            self.maxDepth = depth
+            result = self.timedSearch(self.heuristicSearch, game, player, depth, -inf, inf)
+            if result is None:
+                break
+            rscore, bestStep = result
+            if rscore in [inf, -inf]:
+                break  # Game result is known, deeper search won't change it
+        return bestStep
+
+    def findBestStep(self, game, timeLimit=None):
+        """
+        With a time limit (seconds), searches are cut off in time and the best
+        move found so far is returned
+        """
+        start = time.perf_counter()
         player = game.current
         steps = game.getAvailables()
         _, ccBlack, ccWhite = game.chessCount
@@ -556,6 +1103,12 @@ class ReversiAI:
         if len(steps) <= 0:
             return ()
 
+        # Book mode: a precomputed move costs a lookup instead of a search
+        if book is not None:
+            step = book.lookup(player, game.board)
+            if step is not None:
+                return step
+
         # Random mode
         if cc <= (BS - 4) ** 2:
             randSteps = [(x, y) for x, y in steps
@@ -563,25 +1116,146 @@ class ReversiAI:
             if len(randSteps) > 0:
                 return random.choice(randSteps)
 
-        # Final mode: exact search
-        if cc >= BS ** 2 - self.final:
+        # Final mode: exact search, given half of the time
+        if cc >= BS ** 2 - min(self.final, SOLVER_EMPTIES):
             self.maxDepth = BS ** 2 - cc
             self.nodeCount = 0
-            rscore, rstep = self.exactSearch(game, player, self.maxDepth, -inf, inf)
-            if rscore != -inf:
-                return rstep
+            if timeLimit is not None:
+                self.deadline = start + timeLimit / 2
+            result = self.timedSearch(self.solver.solveRoot, game, player)
+            self.deadline = None
+            # Not lost: play it. Lost: the heuristic move may get the opponent to slip
+            if result is not None and result[0] >= 0:
+                return result[1]
 
         # Heuristic search
+        if timeLimit is not None:
+            self.deadline = start + timeLimit
+        bestStep = self.heuristicMove(game, player)
+        self.deadline = None
+        # Out of time before even depth 1 finished
+        return bestStep or steps[0]
+
+    def setParallel(self, parallel):
+        """
+        Search with the helper processes of a ParallelSearch, through its shared table
+        """
+        self.parallel = parallel
+        if parallel is not None:
+            self.table = parallel.table
+
+    def heuristicMove(self, game, player):
+        """
+        iterativeSearch in a new table generation, with the helpers if there are any
+        """
         self.nodeCount = 0
-        self.maxDepth = self.depth
-        rscore, rstep = self.heuristicSearch(game, player, self.maxDepth, -inf, inf)
-        return rstep
+        self.table.newSearch()
+        if self.parallel is None:
+            return self.iterativeSearch(game, player)
+
+        self.parallel.start(game, self.deadline, self.depth)
+        try:
+            return self.iterativeSearch(game, player)
+        finally:
+            self.parallel.stop()
+
+
+def helperLoop(table, conn, index):
+    """
+    Body of a ParallelSearch helper process: search every position it is sent
+    until the deadline or until the main search stops, then wait for the next one
+    """
+    ai = ReversiAI()
+    ai.table = table
+    while True:
+        try:
+            board, current, deadline, generation, depth = conn.recv()
+        except EOFError:
+            return  # The bot is gone
+        game = Reversi()
+        game.load(board, current)
+        table.generation = generation
+        ai.deadline = deadline
+        ai.stopGeneration = generation
+        # Half of the helpers start one ply deeper, so they fill the table ahead of the main search
+        for d in range(1 + index % 2, depth + 1):
+            if ai.timedSearch(ai.heuristicSearch, game, current, d, -inf, inf) is None:
+                break
+
+
+class ParallelSearch:
+    """
+    Lazy SMP: helper processes search the same position as the main search and
+    store everything in one SharedTable. The main search finds their results in the
+    table (cutoffs, better move ordering) and gets deeper in the same time.
+    Helpers are forked once and serve every move of the game, they exit when the
+    bot's process goes away and their pipe closes
+    """
+
+    def __init__(self, processes=None):
+        if processes is None:
+            processes = SEARCH_PROCESSES
+        self.table = SharedTable()
+        self.conns = []
+        self.pids = []
+        for index in range(1, processes):
+            reader, writer = multiprocessing.Pipe(duplex=False)
+            pid = os.fork()
+            if pid == 0:
+                # Only the bot may hold the writing ends, or helpers would never see EOF
+                try:
+                    writer.close()
+                    for conn in self.conns:
+                        conn.close()
+                    helperLoop(self.table, reader, index)
+                finally:
+                    os._exit(0)
+            reader.close()
+            self.conns.append(writer)
+            self.pids.append(pid)
+
+    def start(self, game, deadline, depth):
+        for conn in self.conns:
+            conn.send((game.board, game.current, deadline, self.table.generation, depth))
+
+    def stop(self):
+        self.table.stop()
+
+    def close(self):
+        self.stop()
+        for conn in self.conns:
+            conn.close()
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+        self.conns, self.pids = [], []
+
+
+_parallel = None
+
+
+def getParallel():
+    """
+    The bot's ParallelSearch, started on its first move
+    None unless SEARCH_PROCESSES asks for helpers, or if they can't be started
+    """
+    global _parallel
+    if _parallel is None and SEARCH_PROCESSES > 1:
+        try:
+            _parallel = ParallelSearch()
+        except OSError:
+            _parallel = False
+    return _parallel or None
 
 
 def get_move(me, board):
+    start = time.perf_counter()
     game = Reversi()
-    game.board = board
-    game.current = me
+    game.load(board, me)
     reversiai = ReversiAI()
-    reversiai.depth = 2
-    return reversiai.findBestStep(game)
\ No newline at end of file
+    reversiai.depth = MAX_DEPTH
+    parallel = getParallel()
+    reversiai.setParallel(parallel)
+    # All processes search until the same deadline and the cpu budget covers them together
+    processes = 1 + len(parallel.pids) if parallel is not None else 1
+    # Forking the helpers on the first move comes out of that move's time
+    return reversiai.findBestStep(game, TIMEOUT * TIME_BUDGET / processes - (time.perf_counter() - start))
\ No newline at end of file
@@ -0,0 +1,90 @@
+import random
+import pytest
+import src.reversi as reversi
+import src.bitboard as bitboard
+
+
+GAMES = 100
+
+
+#Play the same seeded random games on the list engine and the bitboard engine, and
+#compare them on every position. Random moves are sometimes replaced by an illegal
+#one, so both engines also have to agree on how a game is lost
+def random_games(seed, games=GAMES):
+    rng = random.Random(seed)
+    for _ in range(games):
+        yield rng, reversi.reversi(), bitboard.reversi()
+
+
+def other(me):
+    return reversi.SECOND if me == reversi.FIRST else reversi.FIRST
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_same_as_list_engine(seed):
+    for rng, game, bits in random_games(seed):
+        me = reversi.FIRST
+        while game.winner() == reversi.UNKNOWN:
+            assert bits.winner() == reversi.UNKNOWN
+            assert game.board == bits.board
+
+            for x in range(-1, reversi.BOARD_SIZE + 1):
+                for y in range(-1, reversi.BOARD_SIZE + 1):
+                    assert game.can_move(x, y, me) == bits.can_move(x, y, me), (x, y)
+
+            moves = game.get_moves(me)
+            assert moves == bits.get_moves(me)
+            if moves:
+                if rng.random() < 0.01:
+                    x, y = rng.randrange(-1, 9), rng.randrange(-1, 9)
+                else:
+                    x, y = rng.choice(sorted(moves))
+                assert (game.play(x, y, me) is None) == (bits.play(x, y, me) is None)
+            me = other(me)
+
+        assert game.winner() == bits.winner()
+        assert game.board == bits.board
+        for p in [reversi.FIRST, reversi.SECOND]:
+            assert game.count(p) == bits.count(p)
+
+
+@pytest.mark.parametrize("seed", [4, 5])
+def test_undo_redo(seed):
+    for rng, game, bits in random_games(seed, GAMES // 4):
+        me = reversi.FIRST
+        deltas = []
+        boards = [game.get_board()]
+        while game.winner() == reversi.UNKNOWN:
+            moves = game.get_moves(me)
+            if moves:
+                x, y = rng.choice(sorted(moves))
+                deltas.append((game.play(x, y, me), bits.play(x, y, me)))
+            else:
+                deltas.append((game.pass_move(me), bits.pass_move(me)))
+            boards.append(game.get_board())
+            assert game.board == bits.board
+            me = other(me)
+
+        for i in range(len(deltas) - 1, -1, -1):
+            game.undo(deltas[i][0])
+            bits.undo(deltas[i][1])
+            assert game.board == boards[i] == bits.board
+            for p in [reversi.FIRST, reversi.SECOND]:
+                assert game.get_moves(p) == bits.get_moves(p)
+
+        for i, (delta, bits_delta) in enumerate(deltas):
+            game.redo(delta)
+            bits.redo(bits_delta)
+            assert game.board == boards[i + 1] == bits.board
+        assert game.winner() == bits.winner() != reversi.UNKNOWN
+
+
+def test_board_assignment_drops_cached_moves():
+    for game in [reversi.reversi(), bitboard.reversi()]:
+        game.winner()
+        board = [[reversi.UNKNOWN] * reversi.BOARD_SIZE for _ in range(reversi.BOARD_SIZE)]
+        board[0][0] = reversi.FIRST
+        board[0][1] = reversi.SECOND
+        game.board = board
+        assert list(game.get_moves(reversi.FIRST)) == [(0, 2)]
+        assert game.can_move(0, 2, reversi.FIRST)
@@ -0,0 +1,109 @@
+import os, random, sys
+import pytest
+import src.reversi as reversi
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "unused_bots"))
+import dalit
+
+
+POSITIONS = 300
+
+
+def other(me):
+    return reversi.SECOND if me == reversi.FIRST else reversi.FIRST
+
+
+#(board, player to move) after `plies` random moves of a seeded game, None if it ended
+#before. Passes are played when a player has no move
+def random_position(rng, plies):
+    game = reversi.reversi()
+    me = reversi.FIRST
+    for _ in range(plies):
+        if game.winner() != reversi.UNKNOWN:
+            return None
+        moves = game.get_moves(me)
+        if moves:
+            game.play(*rng.choice(sorted(moves)), me)
+        me = other(me)
+    if game.winner() != reversi.UNKNOWN:
+        return None
+    if not game.get_moves(me):
+        me = other(me)
+    return game.get_board(), me
+
+
+def load(board, me):
+    game = dalit.Reversi()
+    game.load([list(l) for l in board], me)
+    return game
+
+
+def test_numpy_evaluators_match():
+    pytest.importorskip("numpy")
+    rng = random.Random(1)
+    ai = dalit.ReversiAI()
+    checked = 0
+    while checked < POSITIONS:
+        position = random_position(rng, rng.randrange(1, 60))
+        if position is None:
+            continue
+        game = load(*position)
+        for me in [dalit.BLACK, dalit.WHITE]:
+            assert ai.heuristicEval_3(game, me) == ai.heuristicEval_3_np(game, me), position
+            assert ai.heuristicEval_4(game, me) == ai.heuristicEval_4_np(game, me), position
+        checked += 1
+
+
+#exact final disc difference for `me` to move, by full minimax on the list engine
+def brute_force(game, me):
+    moves = game.get_moves(me)
+    if not moves:
+        if not game.get_moves(other(me)):
+            return game.count(me) - game.count(other(me))
+        delta = game.pass_move(me)
+        score = -brute_force(game, other(me))
+        game.undo(delta)
+        return score
+
+    best = -reversi.BOARD_SIZE ** 2
+    for x, y in list(moves):
+        delta = game.play(x, y, me)
+        best = max(best, -brute_force(game, other(me)))
+        game.undo(delta)
+    return best
+
+
+#the position after a move, for `me` to move next
+def after(board, move, me):
+    game = reversi.reversi()
+    game.board = [list(l) for l in board]
+    game.play(*move, me)
+    return game
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_solver_matches_brute_force(seed):
+    rng = random.Random(seed)
+    checked = 0
+    while checked < 5:
+        position = random_position(rng, 60 - rng.randrange(4, 9))
+        if position is None:
+            continue
+        board, me = position
+        if sum(l.count(reversi.UNKNOWN) for l in board) > 8:
+            continue
+        game = reversi.reversi()
+        game.board = [list(l) for l in board]
+        exact = brute_force(game, me)
+
+        solver = dalit.ReversiAI().solver
+        score, move = solver.solveRoot(load(board, me), me, -reversi.BOARD_SIZE ** 2, reversi.BOARD_SIZE ** 2)
+        assert score == exact, board
+        assert -brute_force(after(board, move, me), other(me)) == exact, board
+
+        #the default window only has to get win, draw or loss right, with a move that keeps it
+        score, move = solver.solveRoot(load(board, me), me)
+        assert (score > 0) - (score < 0) == (exact > 0) - (exact < 0), board
+        kept = -brute_force(after(board, move, me), other(me))
+        assert (kept > 0) - (kept < 0) == (exact > 0) - (exact < 0), board
+        checked += 1
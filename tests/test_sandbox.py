@@ -0,0 +1,104 @@
+import os, sys, time
+import pytest
+import src.reversi as reversi
+import src.bitboard as bitboard
+import src.sandbox as sandbox
+
+
+TIMEOUT = 0.7
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="the sandbox follows bots through /proc")
+
+
+#A bot that starts a process on its first move and then plays legal moves. The process
+#leaves the bot's session (and with `detach` its parent too), writes its pid and spins
+BOT = """
+import os
+import src.reversi as reversi
+
+started = []
+
+def get_move(me, board):
+    if not started:
+        started.append(1)
+        pid = os.fork()
+        if pid == 0:
+            if not {detach} or os.fork() == 0:
+                os.setsid()
+                with open({pid_path!r}, "w") as f:
+                    f.write(str(os.getpid()))
+                while True:
+                    pass
+            os._exit(0)
+        if {detach}:
+            os.waitpid(pid, 0)
+
+    game = reversi.reversi(len(board))
+    game.board = board
+    return sorted(game.get_moves(me))[0]
+"""
+
+
+def write_bot(tmp_path, monkeypatch, name, detach):
+    pid_path = str(tmp_path / (name + ".pid"))
+    (tmp_path / (name + ".py")).write_text(BOT.format(detach=detach, pid_path=pid_path))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return pid_path
+
+
+def read_pid(pid_path):
+    deadline = time.perf_counter() + 5
+    while not os.path.exists(pid_path) or not open(pid_path).read():
+        assert time.perf_counter() < deadline, "the bot's process never started"
+        time.sleep(0.01)
+    return int(open(pid_path).read())
+
+
+def running(pid):
+    fields = sandbox.stat(pid)
+    return fields is not None and fields[0] != b"Z"
+
+
+def position():
+    return bitboard.to_bitboards(reversi.reversi().board)
+
+
+#the process keeps its parent (the bot) but not its session: it is still charged to
+#the bot and killed with it
+def test_process_in_own_session_is_charged_and_reaped(tmp_path, monkeypatch):
+    pid_path = write_bot(tmp_path, monkeypatch, "sandbox_setsid_bot", False)
+    worker = sandbox.bot_worker("sandbox_setsid_bot", TIMEOUT)
+    try:
+        worker.get_move(reversi.FIRST, *position())
+        pid = read_pid(pid_path)
+        assert running(pid)
+
+        #it spins between the moves, that counts against the next one
+        time.sleep(3 * TIMEOUT)
+        with pytest.raises(TimeoutError):
+            worker.get_move(reversi.FIRST, *position())
+        assert not running(pid)
+    finally:
+        worker.close()
+
+
+#the process leaves its parent too, it is passed to this process and killed right away
+def test_detached_process_is_reaped(tmp_path, monkeypatch):
+    pid_path = write_bot(tmp_path, monkeypatch, "sandbox_detach_bot", True)
+    worker = sandbox.bot_worker("sandbox_detach_bot", TIMEOUT)
+    try:
+        worker.get_move(reversi.FIRST, *position())
+        pid = read_pid(pid_path)
+        worker.get_move(reversi.FIRST, *position())
+        assert not running(pid)
+    finally:
+        worker.close()
+
+
+def test_close_reaps_the_whole_tree(tmp_path, monkeypatch):
+    pid_path = write_bot(tmp_path, monkeypatch, "sandbox_close_bot", False)
+    worker = sandbox.bot_worker("sandbox_close_bot", TIMEOUT)
+    worker.get_move(reversi.FIRST, *position())
+    pid = read_pid(pid_path)
+    worker.close()
+    assert not running(pid)